@@ -8,6 +8,17 @@ class Settings(BaseSettings):
     anthropic_api_key: str = ""
     openai_api_key: str = ""
     roboflow_api_key: str = ""
+    # Torch device for FastSAM inference, e.g. "cpu", "cuda:0" or "mps"
+    segmentation_device: str = "cpu"
+    # Caches of LLM output: Claude replies and Gemini renders, both in memory
+    # and in SQLite; set LLM_CACHE_ENABLED=false to bypass all of them
+    llm_cache_enabled: bool = True
+    llm_cache_path: str = "llm_cache.sqlite3"
+    llm_cache_ttl_days: int = 7
+    # Maximum Claude requests in flight across all concurrent requests
+    max_concurrent_llm_calls: int = 8
+    # Maximum concurrent downloads when a request lists several image URLs
+    image_fetch_concurrency: int = 5
 
     class Config:
         env_file = ".env"
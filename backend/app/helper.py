@@ -1,5 +1,7 @@
+import asyncio
 import httpx
 import base64
+from app.config import get_settings
 
 
 ALLOWED_IMAGE_TYPES = {
@@ -12,8 +14,17 @@ ALLOWED_IMAGE_TYPES = {
 }
 
 
-async def fetch_image_from_url(url: str) -> tuple[bytes, str]:
-    """Fetch an image from a URL or decode from data URI and return it as bytes along with mime type."""
+# httpx's default timeout, applied per request so it also holds on shared clients
+FETCH_TIMEOUT = httpx.Timeout(5.0)
+
+
+async def fetch_image_from_url(
+    url: str, client: httpx.AsyncClient | None = None
+) -> tuple[bytes, str]:
+    """Fetch an image from a URL or decode from data URI and return it as bytes along with mime type.
+
+    Pass `client` to reuse its pooled connections; otherwise a client is opened for this call.
+    """
     if url.startswith("data:"):
         parts = url.split(",", 1)
         header = parts[0]
@@ -26,13 +37,38 @@ async def fetch_image_from_url(url: str) -> tuple[bytes, str]:
         image_bytes = base64.b64decode(data)
         return image_bytes, mime_type
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url)
-        response.raise_for_status()
+    if client is None:
+        async with httpx.AsyncClient() as client:
+            return await fetch_image_from_url(url, client)
 
-        mime_type = response.headers.get("content-type", "image/jpeg").split(";")[0].strip()
+    response = await client.get(url, timeout=FETCH_TIMEOUT)
+    response.raise_for_status()
 
-        if mime_type not in ALLOWED_IMAGE_TYPES:
-            mime_type = "image/jpeg"
+    mime_type = response.headers.get("content-type", "image/jpeg").split(";")[0].strip()
+
+    if mime_type not in ALLOWED_IMAGE_TYPES:
+        mime_type = "image/jpeg"
+
+    return response.content, mime_type
+
+
+async def fetch_images_from_urls(
+    urls: list[str], client: httpx.AsyncClient | None = None
+) -> list[tuple[bytes, str]]:
+    """Fetch several images concurrently, returning (bytes, mime type) pairs in URL order.
+
+    At most `image_fetch_concurrency` downloads are in flight at once. All of
+    them share `client` (or one client opened for the batch), so repeated
+    hosts reuse the same TLS connections.
+    """
+    if client is None:
+        async with httpx.AsyncClient() as client:
+            return await fetch_images_from_urls(urls, client)
+
+    semaphore = asyncio.Semaphore(get_settings().image_fetch_concurrency)
+
+    async def fetch(url: str) -> tuple[bytes, str]:
+        async with semaphore:
+            return await fetch_image_from_url(url, client)
 
-        return response.content, mime_type
+    return list(await asyncio.gather(*(fetch(url) for url in urls)))
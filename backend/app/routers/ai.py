@@ -1,15 +1,26 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Request
 from fastapi.responses import StreamingResponse
-from typing import Optional, List
+from typing import Optional, List, Iterator
+from io import BytesIO
 import json
 from app.services.ai_service import ai_service
-from app.helper import fetch_image_from_url, ALLOWED_IMAGE_TYPES
+from app.helper import fetch_images_from_urls, ALLOWED_IMAGE_TYPES
 
 router = APIRouter(prefix="/ai", tags=["AI"])
 
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def iter_chunks(result: BytesIO | bytes) -> Iterator[bytes]:
+    """Yield generated image bytes in fixed-size chunks for streaming."""
+    if isinstance(result, bytes):
+        result = BytesIO(result)
+    return iter(lambda: result.read(STREAM_CHUNK_SIZE), b"")
+
 
 @router.post("/llm")
 async def llm(
+    request: Request,
     prompt: Optional[str] = Form(None),
     messages: Optional[str] = Form(None),
     image_urls: Optional[str] = Form(None),
@@ -42,9 +53,11 @@ async def llm(
 
         if image_urls:
             urls = json.loads(image_urls)
-            for url in urls:
-                img_bytes, mime_type = await fetch_image_from_url(url)
-                image_list.append((img_bytes, mime_type))
+            image_list.extend(
+                await fetch_images_from_urls(
+                    urls, getattr(request.app.state, "http_client", None)
+                )
+            )
 
         if messages:
             messages_list = json.loads(messages)
@@ -65,6 +78,7 @@ async def llm(
 
 @router.post("/image")
 async def image(
+    request: Request,
     prompt: str = Form(...),
     image_urls: Optional[str] = Form(None),
     images: Optional[List[UploadFile]] = File(None),
@@ -91,13 +105,16 @@ async def image(
 
         if image_urls:
             urls = json.loads(image_urls)
-            for url in urls:
-                img_bytes, mime_type = await fetch_image_from_url(url)
-                image_list.append((img_bytes, mime_type))
+            image_list.extend(
+                await fetch_images_from_urls(
+                    urls, getattr(request.app.state, "http_client", None)
+                )
+            )
 
         result = await ai_service.generate_image(prompt, images=image_list if image_list else None)
 
-        return StreamingResponse(result, media_type="image/png")
+        # Iterating a BytesIO directly would split the PNG on newline bytes
+        return StreamingResponse(iter_chunks(result), media_type="image/png")
     except json.JSONDecodeError:
         raise HTTPException(status_code=400, detail="Invalid JSON format for image_urls")
     except Exception as e:
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, UploadFile, File, Form
+from fastapi import APIRouter, UploadFile, File, Form, Request
 from fastapi.responses import Response, JSONResponse
 from app.services.image_generation_service import ImageGenerationService
 from app.services.minglun_service import MingLunService
@@ -60,10 +60,13 @@ async def generate_floorplan(sketch: UploadFile = File(...)):
 
 
 @router.post("/extract")
-async def extract_objects(floorplan: UploadFile = File(...)):
+async def extract_objects(request: Request, floorplan: UploadFile = File(...)):
     floorplan_bytes = await floorplan.read()
 
-    service = MingLunService()
+    service = MingLunService(
+        http_client=getattr(request.app.state, "http_client", None),
+        llm_semaphore=getattr(request.app.state, "llm_semaphore", None),
+    )
     objects_data = await service.extract_objects(floorplan_bytes)
 
     boundary_service = BoundaryExtractionService()
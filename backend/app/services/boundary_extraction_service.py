@@ -2,7 +2,9 @@ import cv2
 import numpy as np
 import supervision as sv
 from inference_sdk import InferenceHTTPClient
+from PIL import ExifTags, Image
 import json
+import logging
 import os
 from typing import List, Dict, Any
 from dotenv import load_dotenv
@@ -10,6 +12,8 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class BoundaryExtractionService:
     """Service for extracting and classifying boundary elements (walls, doors, windows) from floorplan images."""
 
@@ -48,13 +52,12 @@ class BoundaryExtractionService:
                 "bbox_pixels": {"x1": int, "y1": int, "x2": int, "y2": int}
             }
         """
-        print("START BOUNDARY DETECTION")
+        logger.debug("Starting boundary detection")
         # Convert bytes to numpy array
         nparr = np.frombuffer(floorplan_bytes, np.uint8)
         image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
         if image is None:
-            print("EARLY RETURN BOUNDARY DETECTION")
             raise ValueError("Could not decode image from bytes")
         
         img_height, img_width = image.shape[:2]
@@ -127,7 +130,7 @@ class BoundaryExtractionService:
             json_path = os.path.join(debug_dir, "wall_detections.json")
             with open(json_path, "w") as f:
                 json.dump(detections_list, f, indent=2)
-            print(f"💾 Saved wall detections to {json_path}")
+            logger.info("Saved wall detections to %s", json_path)
             
             # Create and save annotated overlay
             detections_sv = sv.Detections.from_inference(result)
@@ -146,37 +149,43 @@ class BoundaryExtractionService:
             # Save overlay
             overlay_path = os.path.join(debug_dir, "segmented_overlay.png")
             cv2.imwrite(overlay_path, annotated_image)
-            print(f"✅ Saved annotated overlay to {overlay_path}")
+            logger.info("Saved annotated overlay to %s", overlay_path)
                 
-        print("END BOUNDARY DETECTION")
+        logger.debug("Finished boundary detection: %d detections", len(detections_list))
         
         return detections_list
 
 
 # Legacy function for backward compatibility
-def detect_walls(image_path, model_id="cubicasa5k-2-qpmsa/6"):
+def detect_walls(image_path, model_id="cubicasa5k-2-qpmsa/6", return_result=False):
     """
     Legacy function - Analyze a floor plan image and return detection information as JSON.
     
     Args:
         image_path (str): Path to the floor plan image
         model_id (str): Roboflow model ID to use for inference
+        return_result (bool): Also return the raw Roboflow response, so callers
+            can visualize it without running inference a second time
         
     Returns:
-        list: JSON list of detections
+        list: JSON list of detections, or (detections, raw_result) if return_result
     """
     client = InferenceHTTPClient(
         api_url="https://serverless.roboflow.com",
         api_key=os.getenv("ROBOFLOW_API_KEY")
     )
     
-    # Get image dimensions for normalization
-    image = cv2.imread(image_path)
-    if image is None:
-        print(f"Error: Could not load image from {image_path}")
-        return []
-    
-    img_height, img_width = image.shape[:2]
+    # Get image dimensions for normalization; PIL reads them from the header
+    # without decoding the pixels, which Roboflow reads from the path itself.
+    # Like cv2.imread, honour EXIF orientation: 5-8 rotate by 90 degrees
+    try:
+        with Image.open(image_path) as img:
+            img_width, img_height = img.size
+            if img.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8):
+                img_width, img_height = img_height, img_width
+    except OSError:
+        logger.error("Could not load image from %s", image_path)
+        return ([], None) if return_result else []
     
     # Run inference
     result = client.infer(image_path, model_id=model_id)
@@ -208,6 +217,8 @@ def detect_walls(image_path, model_id="cubicasa5k-2-qpmsa/6"):
             }
             detections_list.append(detection)
     
+    if return_result:
+        return detections_list, result
     return detections_list
 
 if __name__ == "__main__":
@@ -216,7 +227,8 @@ if __name__ == "__main__":
     os.makedirs(output_dir, exist_ok=True)
     
     image_path = "./backend/boundary_debug/floor-plan-5.png"
-    detections = detect_walls(image_path)
+    # Keep the raw result for visualization instead of running inference twice
+    detections, result = detect_walls(image_path, return_result=True)
     
     # Print JSON output
     print("=" * 80)
@@ -231,13 +243,6 @@ if __name__ == "__main__":
         json.dump(detections, f, indent=2)
     print(f"💾 Saved wall detections to {output_file}")
     
-    # Get the raw result for visualization
-    client = InferenceHTTPClient(
-        api_url="https://serverless.roboflow.com",
-        api_key=os.getenv("ROBOFLOW_API_KEY")
-    )
-    result = client.infer(image_path, model_id="cubicasa5k-2-qpmsa/6")
-    
     # Load image (BGR)
     image = cv2.imread(image_path)
     
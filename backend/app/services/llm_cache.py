@@ -0,0 +1,122 @@
+"""
+SQLite cache for LLM responses.
+
+Responses are keyed by a SHA-256 of everything that determines them (model,
+prompts and images), so re-running the same floorplan skips the API calls.
+Text replies and binary outputs (generated images) live in separate tables, so
+images are stored as raw bytes instead of base64 text.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from functools import cache
+from typing import Any, Optional, Tuple
+
+from app.config import get_settings
+
+
+class LLMCache:
+    def __init__(self, path: str, ttl_days: int = 7):
+        """
+        Open (or create) the cache database.
+
+        Args:
+            path: Path to the SQLite database file
+            ttl_days: Entries older than this are treated as misses
+        """
+        self.ttl_seconds = ttl_days * 24 * 60 * 60
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "hash TEXT PRIMARY KEY, response TEXT NOT NULL, created_at INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS llm_cache_created_at ON llm_cache (created_at)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS blob_cache ("
+                "hash TEXT PRIMARY KEY, data BLOB NOT NULL, created_at INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS blob_cache_created_at ON blob_cache (created_at)"
+            )
+            self._purge_expired()
+            self._conn.commit()
+
+    def _purge_expired(self):
+        """Delete entries older than the TTL; the caller must hold the lock."""
+        oldest = int(time.time()) - self.ttl_seconds
+        for table in ("llm_cache", "blob_cache"):
+            self._conn.execute(f"DELETE FROM {table} WHERE created_at < ?", (oldest,))
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Hash JSON-serializable request parts into a cache key."""
+        payload = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def lookup(self, *parts: Any) -> Tuple[str, Optional[str]]:
+        """
+        Build the key for the request parts and read its cached response.
+
+        Hashing large image payloads is CPU-bound, so callers run this in a
+        worker thread together with the database read.
+
+        Returns:
+            Tuple of (key, cached response or None)
+        """
+        key = self.make_key(*parts)
+        return key, self.get(key)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for key, or None if missing or expired."""
+        oldest = int(time.time()) - self.ttl_seconds
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM llm_cache WHERE hash = ? AND created_at >= ?",
+                (key, oldest),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, response: str):
+        """Store a response, replacing any previous entry for key, and drop expired ones."""
+        with self._lock:
+            self._purge_expired()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (hash, response, created_at) VALUES (?, ?, ?)",
+                (key, response, int(time.time())),
+            )
+            self._conn.commit()
+
+    def get_blob(self, key: str) -> Optional[bytes]:
+        """Return the cached binary output for key, or None if missing or expired."""
+        oldest = int(time.time()) - self.ttl_seconds
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM blob_cache WHERE hash = ? AND created_at >= ?",
+                (key, oldest),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_blob(self, key: str, data: bytes):
+        """Store a binary output, replacing any previous entry for key, and drop expired ones."""
+        with self._lock:
+            self._purge_expired()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO blob_cache (hash, data, created_at) VALUES (?, ?, ?)",
+                (key, data, int(time.time())),
+            )
+            self._conn.commit()
+
+@cache
+def get_llm_cache() -> Optional[LLMCache]:
+    """Shared cache instance, or None when caching is disabled in settings."""
+    settings = get_settings()
+    if not settings.llm_cache_enabled:
+        return None
+    return LLMCache(settings.llm_cache_path, settings.llm_cache_ttl_days)
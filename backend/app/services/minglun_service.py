@@ -1,10 +1,20 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+import asyncio
+import httpx
 from app.services.segmentation_service import SegmentationService
 
 
 class MingLunService:
-    def __init__(self):
-        self.segmentation_service = SegmentationService(model_path="FastSAM-s.pt")
+    def __init__(
+        self,
+        http_client: Optional[httpx.AsyncClient] = None,
+        llm_semaphore: Optional[asyncio.Semaphore] = None,
+    ):
+        self.segmentation_service = SegmentationService(
+            model_path="FastSAM-s.pt",
+            http_client=http_client,
+            llm_semaphore=llm_semaphore,
+        )
 
     async def extract_objects(self, floorplan_bytes: bytes) -> List[Dict[str, Any]]:
         """
@@ -7,24 +7,30 @@ Segments furniture objects from floorplan images and classifies them.
 
 import os
 import base64
-import io
+import hashlib
 import json
 import asyncio
-from typing import List, Dict, Any, Tuple
+import threading
+import time
+import logging
+from typing import List, Dict, Any, Optional, Tuple
 import cv2
+import httpx
 import numpy as np
 from google import genai
 from google.genai import types as gemini_types
 from anthropic import AsyncAnthropic
 from ultralytics import FastSAM
-from PIL import Image
 from dotenv import load_dotenv
 from app.config import get_settings
+from app.services.llm_cache import get_llm_cache
 from prompts import REALISTIC_FLOORPLAN_FOR_CLASSIFICATION_PROMPT
 
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 FURNITURE_TYPES = [
     "door",
@@ -49,21 +55,241 @@ FURNITURE_TYPES = [
     "dresser",
 ]
 
+# Prompts are built once at import instead of per object
+_FURNITURE_LIST_STR = "\n".join(f"- {f}" for f in FURNITURE_TYPES)
+
+_CLASSIFICATION_PROMPT = f"""You are a furniture evaluation agent. Your objective is to categorize furniture highlighted within a top-down, 2D floor plan.
+
+You will be provided the following data:
+- A top-down, 2D image of the entire floorplan, with all furniture, fixtures, architecture, rooms, etc.
+- A top-down, photorealistic image of the rendered interior, corresponding exactly to the floorplan.
+- A duplicate of the top-down photorealistic image with a specific piece of furniture highlighted.
+- A zoomed in image of the piece of furniture in isolated.
+
+Your objective is to classify and categorize the piece of furniture based on the data provided to you (images, list of available furniture).
+
+Available furniture/fixture types (YOU MUST PICK THE furniture_type FROM THIS LIST):
+{_FURNITURE_LIST_STR}
+
+Report your answer with the classify_object tool.
+
+Pick correctly!"""
+
+_MATCHING_PROMPT_TEMPLATE = """You are a furniture matching expert. Your task is to identify which product variation most closely resembles the cropped furniture item from a floorplan.
+
+You will be given:
+1. {num_variations} product images showing different variations of {furniture_type}
+2. A cropped image of a {furniture_type} from a top-down floorplan view
+
+Carefully examine the cropped object and compare it with each product variation. Consider:
+- Overall shape and proportions
+- Visual style and design elements
+- Color and material appearance
+- Any distinctive features
+
+Report your answer with the match_variation tool.
+
+The variations are numbered from 0 to {last_index}."""
+
+# Tools Claude is forced to call, so replies arrive as already-parsed input
+# objects that follow these schemas instead of free text
+_CLASSIFY_TOOL = {
+    "name": "classify_object",
+    "description": "Record the classification of the highlighted object.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "furniture_type": {"type": "string", "enum": FURNITURE_TYPES},
+            "confidence": {"type": "string", "enum": ["high", "medium", "low"]},
+            # Short fields come before the free-text reasoning, so they are
+            # written first
+            "rotation": {
+                "type": "integer",
+                "description": "Rotation angle in degrees (0-360), where 0 is north/top "
+                "of image, 90 is east/right, 180 is south/bottom, 270 is west/left",
+            },
+            "reasoning": {
+                "type": "string",
+                "maxLength": 1200,
+                "description": "Detailed explanation: What do you SEE (texture/color)? "
+                "Aspect ratio? Position? Room context?",
+            },
+        },
+        "required": ["furniture_type", "confidence", "rotation", "reasoning"],
+    },
+}
+
+# Reply budget sized from the classify_object schema: the enum fields and
+# rotation take a few tokens, reasoning up to 1200 characters about 300 more,
+# plus the tool-call wrapper. A reply cut off by this budget is an error.
+_CLASSIFY_MAX_TOKENS = 1024
+
+_MATCH_TOOL = {
+    "name": "match_variation",
+    "description": "Record which product variation best matches the cropped object.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "best_match_index": {
+                "type": "integer",
+                "description": "0-based index of the best matching variation",
+            },
+            "confidence": {"type": "string", "enum": ["high", "medium", "low"]},
+            "reasoning": {
+                "type": "string",
+                "maxLength": 400,
+                "description": "One or two sentences on why this variation matches best",
+            },
+        },
+        "required": ["best_match_index", "confidence", "reasoning"],
+    },
+}
+
+# Reply budget sized from the match_variation schema: the index and confidence
+# take a few tokens, reasoning up to 400 characters about 100 more, plus the
+# tool-call wrapper. A reply cut off by this budget is an error, so leave room.
+_MATCH_MAX_TOKENS = 512
+
+# Debug dumps are only inspected by eye, so smaller optimized JPEGs are enough
+_DEBUG_JPEG_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 85, cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+
+# FastSAM models shared by every SegmentationService instance, keyed by path
+_MODELS: Dict[str, FastSAM] = {}
+_MODELS_LOCK = threading.Lock()
+# Ultralytics predictors are not thread-safe, so inference on a shared model
+# is serialized
+_INFERENCE_LOCK = threading.Lock()
+
+# Gemini realistic renders keyed by the SHA-1 of the input floorplan JPEG, so
+# re-running the pipeline on the same floorplan skips the Gemini call; unused
+# when llm_cache_enabled is off
+_REALISTIC_CACHE: Dict[str, np.ndarray] = {}
+_REALISTIC_CACHE_SIZE = 16
+
+
+class _FastSAMBatcher:
+    """
+    Micro-batches concurrent FastSAM calls into a single forward pass.
+
+    The first caller to arrive becomes the leader: it runs every queued request
+    with the same model and arguments as one batch and hands each caller its
+    own result; only images of the same shape share a batch. Later callers
+    block until their result is ready or until they can lead the next batch,
+    so requests arriving during a forward pass share the next one. A leader that is alone runs immediately; only when others
+    are already queued does it wait up to max_wait seconds to fill the batch.
+    """
+
+    def __init__(self, max_batch: int = 8, max_wait: float = 0.02):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._pending: List[Dict[str, Any]] = []
+        self._busy = False
+
+    def predict(self, model: FastSAM, image: np.ndarray, **kwargs) -> Any:
+        """
+        Run FastSAM on a single image, batched with any concurrent callers.
+
+        Args:
+            model: Loaded FastSAM model
+            image: BGR image to segment
+            **kwargs: Inference arguments passed through to the model
+
+        Returns:
+            The Ultralytics result for this image
+        """
+        request = {"model": model, "image": image, "kwargs": kwargs, "done": False}
+
+        with self._cond:
+            self._pending.append(request)
+            self._cond.notify_all()
+            while not request["done"] and self._busy:
+                self._cond.wait()
+            if request["done"]:
+                return self._unwrap(request)
+            self._busy = True
+
+            # Under load, give concurrent callers a moment to join this batch;
+            # a lone caller on an idle service doesn't wait at all
+            if len(self._pending) > 1:
+                deadline = time.monotonic() + self.max_wait
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+            batch = [request] + [
+                r
+                for r in self._pending
+                if r is not request
+                and r["model"] is model
+                and r["kwargs"] == kwargs
+                and r["image"].shape == image.shape
+                and r["image"].dtype == image.dtype
+            ][: self.max_batch - 1]
+            self._pending = [r for r in self._pending if not any(r is b for b in batch)]
+
+        try:
+            with _INFERENCE_LOCK:
+                results = model([r["image"] for r in batch], **kwargs)
+            for r, result in zip(batch, results):
+                r["result"] = result
+        except Exception as e:
+            for r in batch:
+                r["error"] = e
+        finally:
+            # Always release the batch, even on KeyboardInterrupt or similar,
+            # so no caller is left waiting on a leader that never returns
+            with self._cond:
+                for r in batch:
+                    if "result" not in r and "error" not in r:
+                        r["error"] = RuntimeError("FastSAM batch was interrupted")
+                    r["done"] = True
+                self._busy = False
+                self._cond.notify_all()
+
+        return self._unwrap(request)
+
+    @staticmethod
+    def _unwrap(request: Dict[str, Any]) -> Any:
+        if "error" in request:
+            raise request["error"]
+        return request["result"]
+
+
+# Shared by every SegmentationService instance so concurrent requests batch
+_BATCHER = _FastSAMBatcher()
+
 
 class SegmentationService:
-    def __init__(self, model_path: str = "FastSAM-s.pt"):
+    def __init__(
+        self,
+        model_path: str = "FastSAM-s.pt",
+        http_client: Optional[httpx.AsyncClient] = None,
+        llm_semaphore: Optional[asyncio.Semaphore] = None,
+    ):
         """
         Initialize the segmentation service.
 
         Args:
             model_path: Path to the FastSAM model file
+            http_client: Shared connection pool for the Anthropic client; it
+                opens its own when omitted
+            llm_semaphore: Process-wide cap on in-flight Claude requests; a
+                private one sized by settings is used when omitted
         """
         self.model_path = model_path
         self.model = None
 
-        # Use Gemini for realistic rendering
         settings = get_settings()
+        # FP16 halves memory traffic on GPUs; CPU inference stays in FP32
+        self.device = settings.segmentation_device
+        self.half = self.device != "cpu"
+
+        # Use Gemini for realistic rendering
         self.gemini_api_key = settings.gemini_api_key
+        self.render_model = "gemini-2.5-flash-image"
         self.gemini_client = (
             genai.Client(api_key=self.gemini_api_key).aio
             if self.gemini_api_key
@@ -73,33 +299,75 @@ class SegmentationService:
         # Use Claude Sonnet 4.5 for classification (excellent vision & agent capabilities)
         self.anthropic_api_key = settings.anthropic_api_key
         self.anthropic_client = (
-            AsyncAnthropic(api_key=self.anthropic_api_key)
+            AsyncAnthropic(api_key=self.anthropic_api_key, http_client=http_client)
             if self.anthropic_api_key
             else None
         )
         self.classification_model = "claude-sonnet-4-5-20250929"  # Best vision model
+        # Caps in-flight Claude requests so large floorplans stay within rate limits
+        self._llm_semaphore = llm_semaphore or asyncio.Semaphore(
+            settings.max_concurrent_llm_calls
+        )
+        # Parsed-reply cache shared across requests (None when disabled)
+        self.llm_cache = get_llm_cache()
+        # Also gates the in-memory render cache
+        self.cache_enabled = settings.llm_cache_enabled
+
+        # Encoded product images per furniture directory, shared by all objects
+        self._variation_cache: Dict[str, List[Tuple[str, str]]] = {}
+        self._variation_locks: Dict[str, asyncio.Lock] = {}
 
     def _load_model(self):
-        """Lazy load the FastSAM model."""
-        if self.model is None:
-            self.model = FastSAM(self.model_path)
+        """Lazy load the FastSAM model, sharing the weights across instances."""
+        if self.model is not None:
+            return
+
+        model = _MODELS.get(self.model_path)
+        if model is None:
+            with _MODELS_LOCK:
+                model = _MODELS.get(self.model_path)
+                if model is None:
+                    model = FastSAM(self.model_path)
+                    _MODELS[self.model_path] = model
+
+        self.model = model
+
+    def warmup(self):
+        """Load the model and run a tiny inference so the first request is fast."""
+        self._load_model()
+        with _INFERENCE_LOCK:
+            self.model(
+                np.zeros((64, 64, 3), dtype=np.uint8),
+                device=self.device,
+                half=self.half,
+                retina_masks=True,
+                imgsz=1024,
+                verbose=False,
+            )
 
-    def _calculate_mask_overlap(self, mask1: np.ndarray, mask2: np.ndarray) -> float:
-        """Calculate the overlap percentage between two masks."""
-        intersection = np.logical_and(mask1, mask2)
-        intersection_area = np.sum(intersection)
+    def _mask_bbox(self, mask_bool: np.ndarray):
+        """
+        Get the inclusive bounding box of a boolean mask.
 
-        area1 = np.sum(mask1)
-        area2 = np.sum(mask2)
+        Returns:
+            Tuple of (y1, x1, y2, x2), or None if the mask is empty
+        """
+        rows = mask_bool.any(axis=1)
+        cols = mask_bool.any(axis=0)
+        if not rows.any():
+            return None
 
-        smaller_area = min(area1, area2)
-        overlap = intersection_area / smaller_area if smaller_area > 0 else 0.0
+        y1 = int(rows.argmax())
+        y2 = len(rows) - int(rows[::-1].argmax()) - 1
+        x1 = int(cols.argmax())
+        x2 = len(cols) - int(cols[::-1].argmax()) - 1
 
-        return overlap
+        return y1, x1, y2, x2
 
     def _filter_masks(
         self,
-        masks,
+        masks_bool: np.ndarray,
+        mask_areas: np.ndarray,
         img_shape,
         max_size_ratio: float = 0.5,
         overlap_threshold: float = 0.5,
@@ -107,96 +375,113 @@ class SegmentationService:
         """
         Filter masks based on size and overlap criteria (from segment_image.py).
 
+        Args:
+            masks_bool: Boolean masks of shape (N, H, W) at image resolution
+            mask_areas: Pixel area of each mask, shape (N,)
+            img_shape: Shape of the source image
+
         Returns:
             List of indices of masks to keep
         """
         img_height, img_width = img_shape[:2]
-        num_masks = len(masks)
+        num_masks = len(masks_bool)
 
         if num_masks == 0:
             return []
 
-        # Store mask data
-        mask_data = []
-
-        for i, mask in enumerate(masks):
-            # Convert to numpy
-            if hasattr(mask, "cpu"):
-                mask_np = mask.cpu().numpy().astype(np.float32)
-            else:
-                mask_np = mask.astype(np.float32)
-
-            # Resize to image dimensions
-            if mask_np.shape != (img_height, img_width):
-                mask_np = cv2.resize(mask_np, (img_width, img_height))
-
-            mask_bool = mask_np > 0.5
+        # Indices of masks passing the size filter
+        candidates = []
 
+        for i, mask_bool in enumerate(masks_bool):
             # Get bounding box
-            coords = np.argwhere(mask_bool)
-            if len(coords) == 0:
+            bbox = self._mask_bbox(mask_bool)
+            if bbox is None:
                 continue
 
-            y1, x1 = coords.min(axis=0)
-            y2, x2 = coords.max(axis=0)
+            y1, x1, y2, x2 = bbox
             width = x2 - x1 + 1
             height = y2 - y1 + 1
-            area = np.sum(mask_bool)
 
             # Check size ratio
             width_ratio = width / img_width
             height_ratio = height / img_height
 
             if width_ratio > max_size_ratio or height_ratio > max_size_ratio:
-                print(
-                    f"  Filtering mask {i}: too large "
-                    f"(width: {width_ratio:.1%}, height: {height_ratio:.1%})"
+                logger.debug(
+                    "Filtering mask %d: too large (width: %.1f%%, height: %.1f%%)",
+                    i,
+                    width_ratio * 100,
+                    height_ratio * 100,
                 )
                 continue
 
-            mask_data.append(
-                {
-                    "index": i,
-                    "mask": mask_bool,
-                    "area": area,
-                }
-            )
-
-        # Sort by area (largest first)
-        mask_data.sort(key=lambda x: x["area"], reverse=True)
+            candidates.append(i)
 
-        # Filter overlapping masks
-        to_keep = []
-        to_remove = set()
+        if not candidates:
+            return []
 
-        for i in range(len(mask_data)):
-            if i in to_remove:
-                continue
+        # Sort by area (largest first); the stable sort keeps ties in mask order
+        candidates = np.asarray(candidates, dtype=np.intp)
+        order = np.argsort(-mask_areas[candidates], kind="stable")
+        indices = candidates[order]
+        areas = np.asarray(mask_areas, dtype=np.int64)[indices]
 
-            to_keep.append(mask_data[i]["index"])
-            mask_i = mask_data[i]["mask"]
+        # Bit-pack every mask row in one call so intersections are popcounts
+        # over 1/8 of the bytes
+        packed = np.packbits(masks_bool.reshape(num_masks, -1), axis=1)[indices]
 
-            # Check overlap with remaining masks
-            for j in range(i + 1, len(mask_data)):
-                if j in to_remove:
-                    continue
+        # Filter overlapping masks: each kept mask removes, in one vectorized
+        # step, every smaller remaining mask it overlaps
+        alive = np.ones(len(indices), dtype=bool)
 
-                mask_j = mask_data[j]["mask"]
+        for i in range(len(indices)):
+            if not alive[i]:
+                continue
 
-                # Calculate overlap
-                overlap = self._calculate_mask_overlap(mask_i, mask_j)
+            # Check overlap with remaining masks
+            rest = np.flatnonzero(alive[i + 1 :]) + i + 1
+            if len(rest) == 0:
+                break
+
+            # Overlap relative to the smaller mask of each pair
+            intersection = np.bitwise_count(packed[rest] & packed[i]).sum(axis=1)
+            overlap = intersection / np.minimum(areas[i], areas[rest])
+
+            # If overlap exceeds threshold, remove smaller mask (j)
+            overlapping = overlap > overlap_threshold
+            alive[rest[overlapping]] = False
+
+            for j, mask_overlap in zip(rest[overlapping], overlap[overlapping]):
+                logger.debug(
+                    "Filtering mask %d: overlaps with mask %d by %.1f%%",
+                    indices[j],
+                    indices[i],
+                    mask_overlap * 100,
+                )
 
-                # If overlap exceeds threshold, remove smaller mask (j)
-                if overlap > overlap_threshold:
-                    to_remove.add(j)
-                    print(
-                        f"  Filtering mask {mask_data[j]['index']}: "
-                        f"overlaps with mask {mask_data[i]['index']} by {overlap:.1%}"
-                    )
+        return sorted(indices[alive].tolist())
 
-        return sorted(to_keep)
+    async def _segment_image(
+        self,
+        image: np.ndarray,
+        conf: float = 0.4,
+        iou: float = 0.9,
+        enable_filtering: bool = True,
+        max_size_ratio: float = 0.5,
+        overlap_threshold: float = 0.5,
+    ) -> Tuple[Any, List[Dict], np.ndarray]:
+        """Segment objects in a worker thread so inference doesn't block the event loop."""
+        return await asyncio.to_thread(
+            self._segment_image_sync,
+            image,
+            conf=conf,
+            iou=iou,
+            enable_filtering=enable_filtering,
+            max_size_ratio=max_size_ratio,
+            overlap_threshold=overlap_threshold,
+        )
 
-    def _segment_image(
+    def _segment_image_sync(
         self,
         image: np.ndarray,
         conf: float = 0.4,
@@ -204,7 +489,7 @@ class SegmentationService:
         enable_filtering: bool = True,
         max_size_ratio: float = 0.5,
         overlap_threshold: float = 0.5,
-    ) -> Tuple[Any, List[Dict]]:
+    ) -> Tuple[Any, List[Dict], np.ndarray]:
         """
         Segment objects from an image using FastSAM with filtering.
 
@@ -217,90 +502,139 @@ class SegmentationService:
             overlap_threshold: Overlap threshold for filtering
 
         Returns:
-            Tuple of (results, detected_objects)
+            Tuple of (results, detected_objects, masks_bool), where masks_bool
+            holds every unfiltered mask at image resolution, indexed by each
+            object's "mask_index"
         """
         self._load_model()
 
         img_height, img_width = image.shape[:2]
 
-        # Run FastSAM
-        results = self.model(
-            image,
-            device="cpu",
-            retina_masks=True,
-            imgsz=1024,
-            conf=conf,
-            iou=iou,
-        )
+        # Run FastSAM (batched with any concurrent requests)
+        results = [
+            _BATCHER.predict(
+                self.model,
+                image,
+                device=self.device,
+                half=self.half,
+                retina_masks=True,
+                imgsz=1024,
+                conf=conf,
+                iou=iou,
+            )
+        ]
 
         detected_objects = []
+        masks_bool = np.zeros((0, img_height, img_width), dtype=bool)
 
         for result in results:
             if hasattr(result, "masks") and result.masks is not None:
                 masks = result.masks.data
                 boxes = result.boxes.xyxy if hasattr(result, "boxes") else None
 
-                num_masks_before = len(masks)
-                print(
-                    f"  Number of segments detected (before filtering): {num_masks_before}"
+                # Move all masks to host memory in a single transfer
+                if hasattr(masks, "cpu"):
+                    masks_np = masks.detach().cpu().numpy()
+                else:
+                    masks_np = np.asarray(masks)
+                # FastSAM masks are binary, so a byte per pixel is enough
+                masks_u8 = (masks_np > 0.5).view(np.uint8)
+                if boxes is not None and hasattr(boxes, "cpu"):
+                    boxes = boxes.detach().cpu().numpy()
+
+                # Bring every mask to image resolution once, shared by all passes below
+                if masks_u8.shape[1:] == (img_height, img_width):
+                    # Retina masks already match the image, no resize needed
+                    masks_bool = masks_u8.view(bool)
+                else:
+                    masks_bool = np.empty(
+                        (masks_u8.shape[0], img_height, img_width), dtype=bool
+                    )
+                    for i in range(masks_u8.shape[0]):
+                        # Nearest-neighbour keeps the mask binary
+                        masks_bool[i] = cv2.resize(
+                            masks_u8[i],
+                            (img_width, img_height),
+                            interpolation=cv2.INTER_NEAREST,
+                        ).view(bool)
+
+                num_masks_before = masks_u8.shape[0]
+                # Pixel area of every mask, computed once for filtering and output
+                mask_areas = np.count_nonzero(masks_bool, axis=(1, 2))
+                logger.info(
+                    "Number of segments detected (before filtering): %d",
+                    num_masks_before,
                 )
 
                 # Apply filtering if enabled
                 if enable_filtering and num_masks_before > 0:
-                    print(f"  Applying filters:")
-                    print(f"    - Max size ratio: {max_size_ratio:.0%}")
-                    print(f"    - Overlap threshold: {overlap_threshold:.0%}")
+                    logger.debug(
+                        "Applying filters: max size ratio %.0f%%, overlap threshold %.0f%%",
+                        max_size_ratio * 100,
+                        overlap_threshold * 100,
+                    )
 
                     keep_indices = self._filter_masks(
-                        masks,
+                        masks_bool,
+                        mask_areas,
                         image.shape,
                         max_size_ratio=max_size_ratio,
                         overlap_threshold=overlap_threshold,
                     )
 
-                    print(f"  Number of segments after filtering: {len(keep_indices)}")
+                    logger.info(
+                        "Number of segments after filtering: %d", len(keep_indices)
+                    )
                 else:
                     keep_indices = list(range(num_masks_before))
 
-                for idx, i in enumerate(keep_indices):
-                    mask = masks[i]
-
-                    # Convert mask to numpy
-                    if hasattr(mask, "cpu"):
-                        mask_np = mask.cpu().numpy().astype(np.float32)
-                    else:
-                        mask_np = mask.astype(np.float32)
-
-                    # Resize mask to match image
-                    mask_resized = cv2.resize(mask_np, (img_width, img_height))
-                    mask_bool = mask_resized > 0.5
-
-                    # Get bounding box
-                    if boxes is not None and i < len(boxes):
-                        box = (
-                            boxes[i].cpu().numpy()
-                            if hasattr(boxes[i], "cpu")
-                            else boxes[i]
-                        )
-                        x1, y1, x2, y2 = box
-                    else:
-                        # Calculate from mask
-                        coords = np.argwhere(mask_bool)
-                        if len(coords) == 0:
-                            continue
-                        y1, x1 = coords.min(axis=0)
-                        y2, x2 = coords.max(axis=0)
-
-                    # Calculate dimensions
-                    width_pixels = float(x2 - x1)
-                    height_pixels = float(y2 - y1)
-                    area_pixels = float(np.sum(mask_bool))
-
-                    # Normalize
-                    width_norm = width_pixels / img_width
-                    height_norm = height_pixels / img_height
-                    area_norm = area_pixels / (img_width * img_height)
+                keep = np.asarray(keep_indices, dtype=np.intp)
+                filtered_idx = np.arange(len(keep))
 
+                # Get bounding boxes for all kept masks
+                if boxes is not None and len(boxes) == num_masks_before:
+                    boxes_xyxy = np.asarray(boxes, dtype=np.float64)[keep]
+                else:
+                    # Calculate from masks (single native pass over the bytes each)
+                    rects = np.array(
+                        [cv2.boundingRect(masks_bool[i].view(np.uint8)) for i in keep],
+                        dtype=np.float64,
+                    ).reshape(-1, 4)
+                    non_empty = (rects[:, 2] > 0) & (rects[:, 3] > 0)
+                    keep, filtered_idx, rects = (
+                        keep[non_empty],
+                        filtered_idx[non_empty],
+                        rects[non_empty],
+                    )
+                    boxes_xyxy = np.hstack([rects[:, :2], rects[:, :2] + rects[:, 2:]])
+
+                # Calculate dimensions and normalize, for all objects at once
+                img_size = np.array([img_width, img_height], dtype=np.float64)
+                dims_pixels = boxes_xyxy[:, 2:] - boxes_xyxy[:, :2]
+                dims_norm = dims_pixels / img_size
+                bboxes_norm = boxes_xyxy / np.tile(img_size, 2)
+                areas_pixels = mask_areas[keep].astype(np.float64)
+                areas_norm = areas_pixels / (img_width * img_height)
+
+                for (
+                    (x1, y1, x2, y2),
+                    (nx1, ny1, nx2, ny2),
+                    (width_pixels, height_pixels),
+                    (width_norm, height_norm),
+                    area_pixels,
+                    area_norm,
+                    i,
+                    idx,
+                ) in zip(
+                    boxes_xyxy.tolist(),
+                    bboxes_norm.tolist(),
+                    dims_pixels.tolist(),
+                    dims_norm.tolist(),
+                    areas_pixels.tolist(),
+                    areas_norm.tolist(),
+                    keep.tolist(),
+                    filtered_idx.tolist(),
+                ):
                     obj = {
                         "id": len(detected_objects) + 1,
                         "bbox_pixels": {
@@ -310,10 +644,10 @@ class SegmentationService:
                             "y2": int(y2),
                         },
                         "bbox_normalized": {
-                            "x1": float(x1 / img_width),
-                            "y1": float(y1 / img_height),
-                            "x2": float(x2 / img_width),
-                            "y2": float(y2 / img_height),
+                            "x1": nx1,
+                            "y1": ny1,
+                            "x2": nx2,
+                            "y2": ny2,
                         },
                         "dimensions_pixels": {
                             "width": width_pixels,
@@ -331,12 +665,46 @@ class SegmentationService:
 
                     detected_objects.append(obj)
 
-        return results, detected_objects
+        return results, detected_objects, masks_bool
 
-    def _encode_image_to_base64(self, image: np.ndarray) -> str:
-        """Encode a numpy image array to base64 string."""
-        _, buffer = cv2.imencode(".jpg", image)
-        return base64.b64encode(buffer).decode("utf-8")
+    def _downscale_to_max_edge(self, image: np.ndarray, max_edge: int) -> np.ndarray:
+        """Shrink an image so its longest side is at most max_edge pixels."""
+        h, w = image.shape[:2]
+        scale = min(1.0, max_edge / max(h, w))
+        if scale < 1.0:
+            image = cv2.resize(
+                image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+            )
+        return image
+
+    def _encode_jpeg(self, image: np.ndarray) -> bytes:
+        """Encode a numpy image array to JPEG bytes."""
+        _, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        return buffer.tobytes()
+
+    def _encode_image_to_base64_sync(
+        self, image: np.ndarray, max_edge: int = 1024
+    ) -> str:
+        """
+        Encode a numpy image array to a base64 JPEG string.
+
+        Claude downsamples large images anyway, so images are first shrunk to
+        max_edge on their longest side to keep upload sizes down.
+
+        Args:
+            image: Image to encode
+            max_edge: Maximum size in pixels of the longest side
+        """
+        image = self._downscale_to_max_edge(image, max_edge)
+        return base64.b64encode(self._encode_jpeg(image)).decode("utf-8")
+
+    async def _encode_image_to_base64(
+        self, image: np.ndarray, max_edge: int = 1024
+    ) -> str:
+        """Encode a numpy image array to base64 string in a worker thread."""
+        return await asyncio.to_thread(
+            self._encode_image_to_base64_sync, image, max_edge
+        )
 
     def _extract_object_image(
         self,
@@ -361,14 +729,14 @@ class SegmentationService:
         y2 = min(img_height, bbox_pixels["y2"] + padding_y)
 
         # Crop the region
-        cropped_img = original_image[y1:y2, x1:x2].copy()
+        cropped_img = original_image[y1:y2, x1:x2]
         cropped_mask = mask_bool[y1:y2, x1:x2]
 
-        # Apply mask - set non-object pixels to white background
-        white_background = np.ones_like(cropped_img) * 255
-        result = np.where(cropped_mask[:, :, np.newaxis], cropped_img, white_background)
+        # Apply mask - copy object pixels onto a white background
+        result = np.full_like(cropped_img, 255)
+        cv2.copyTo(cropped_img, cropped_mask.view(np.uint8), result)
 
-        return result.astype(np.uint8)
+        return result
 
     def _create_highlighted_image(
         self,
@@ -383,9 +751,6 @@ class SegmentationService:
         highlighted_img = original_image.copy()
         img_height, img_width = original_image.shape[:2]
 
-        # Create an overlay for the transparent box
-        overlay = highlighted_img.copy()
-
         x1 = bbox_pixels["x1"]
         y1 = bbox_pixels["y1"]
         x2 = bbox_pixels["x2"]
@@ -403,14 +768,11 @@ class SegmentationService:
         x2_padded = min(img_width, x2 + padding_x)
         y2_padded = min(img_height, y2 + padding_y)
 
-        # Draw a semi-transparent colored rectangle (orange/red)
-        cv2.rectangle(
-            overlay, (x1_padded, y1_padded), (x2_padded, y2_padded), (0, 100, 255), -1
-        )  # Filled rectangle in orange
-
-        # Blend the overlay with the original image (30% opacity)
+        # Blend a semi-transparent orange tint into the box region only (30% opacity)
+        roi = highlighted_img[y1_padded : y2_padded + 1, x1_padded : x2_padded + 1]
+        tint = np.full_like(roi, (0, 100, 255))
         alpha = 0.3
-        cv2.addWeighted(overlay, alpha, highlighted_img, 1 - alpha, 0, highlighted_img)
+        cv2.addWeighted(tint, alpha, roi, 1 - alpha, 0, roi)  # Writes in place
 
         # Draw a solid border around the padded object (brighter red)
         cv2.rectangle(
@@ -423,6 +785,28 @@ class SegmentationService:
 
         return highlighted_img
 
+    def _encode_highlighted_image_sync(
+        self, original_image: np.ndarray, bbox_pixels: Dict
+    ) -> str:
+        """Highlight an object in the full image and encode it to base64 JPEG."""
+        highlighted_img = self._create_highlighted_image(original_image, bbox_pixels)
+        return self._encode_image_to_base64_sync(highlighted_img)
+
+    def _write_highlighted_image(
+        self, path: str, original_image: np.ndarray, bbox_pixels: Dict
+    ) -> bool:
+        """Highlight an object in the full image and write it as a debug JPEG."""
+        highlighted_img = self._create_highlighted_image(original_image, bbox_pixels)
+        return cv2.imwrite(path, highlighted_img, _DEBUG_JPEG_PARAMS)
+
+    def _decode_generated_image(self, image_bytes: bytes) -> np.ndarray:
+        """Decode Gemini's returned PNG/JPEG bytes into a BGR array."""
+        # OpenCV decodes straight to BGR, with no intermediate RGB copy
+        image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Could not decode generated image")
+        return image
+
     async def _generate_realistic_floorplan(
         self, floorplan_image: np.ndarray
     ) -> np.ndarray:
@@ -431,129 +815,186 @@ class SegmentationService:
         Uses Gemini image generation to make furniture easier to identify.
         """
         if not self.gemini_client:
-            print("Warning: Cannot generate realistic version without Gemini API key")
+            logger.warning(
+                "Cannot generate realistic version without Gemini API key"
+            )
             return floorplan_image  # Return original if no API key
 
         try:
-            print("  Generating realistic rendered version of floorplan...")
+            logger.info("Generating realistic rendered version of floorplan...")
 
             # Encode floorplan to bytes
-            _, buffer = cv2.imencode(".jpg", floorplan_image)
-            floorplan_bytes = buffer.tobytes()
+            floorplan_bytes = await asyncio.to_thread(self._encode_jpeg, floorplan_image)
+
+            cache_key = hashlib.sha1(floorplan_bytes).hexdigest()
+            cached = _REALISTIC_CACHE.get(cache_key) if self.cache_enabled else None
+            if cached is not None:
+                logger.info("Reusing cached realistic version")
+                return cached
+
+            # Renders are paid calls, so they also persist across restarts
+            stored_key = None
+            image_data = None
+            if self.llm_cache:
+                stored_key = self.llm_cache.make_key(
+                    self.render_model,
+                    REALISTIC_FLOORPLAN_FOR_CLASSIFICATION_PROMPT,
+                    cache_key,
+                )
+                image_data = await asyncio.to_thread(self.llm_cache.get_blob, stored_key)
+                if image_data is not None:
+                    logger.info("Reusing stored realistic version")
+                    stored_key = None  # Already stored, nothing to write back
+
+            if image_data is None:
+                # Build content for Gemini
+                parts = [
+                    gemini_types.Part.from_bytes(
+                        data=floorplan_bytes, mime_type="image/jpeg"
+                    ),
+                    gemini_types.Part(text=REALISTIC_FLOORPLAN_FOR_CLASSIFICATION_PROMPT),
+                ]
+
+                # Generate realistic version
+                response = await self.gemini_client.models.generate_content(
+                    model=self.render_model,
+                    contents=parts,
+                )
 
-            # Build content for Gemini
-            parts = [
-                gemini_types.Part.from_bytes(
-                    data=floorplan_bytes, mime_type="image/jpeg"
-                ),
-                gemini_types.Part(text=REALISTIC_FLOORPLAN_FOR_CLASSIFICATION_PROMPT),
-            ]
+                # Extract generated image
+                image_parts = [
+                    part.inline_data.data
+                    for part in response.candidates[0].content.parts
+                    if part.inline_data
+                ]
 
-            # Generate realistic version
-            response = await self.gemini_client.models.generate_content(
-                model="gemini-2.5-flash-image",  # Image generation model
-                contents=parts,
-            )
+                if not image_parts:
+                    logger.warning("No image generated, using original")
+                    return floorplan_image
+                image_data = image_parts[0]
 
-            # Extract generated image
-            image_parts = [
-                part.inline_data.data
-                for part in response.candidates[0].content.parts
-                if part.inline_data
-            ]
+            try:
+                realistic_image = await asyncio.to_thread(
+                    self._decode_generated_image, image_data
+                )
+            except (OSError, ValueError):
+                logger.warning("Failed to decode generated image, using original")
+                return floorplan_image
 
-            if image_parts:
-                # Convert bytes to numpy array
-                nparr = np.frombuffer(image_parts[0], np.uint8)
-                realistic_image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            if stored_key:
+                await asyncio.to_thread(self.llm_cache.set_blob, stored_key, image_data)
 
-                if realistic_image is not None:
-                    print("  ✓ Successfully generated realistic version")
-                    return realistic_image
-                else:
-                    print("  ✗ Failed to decode generated image, using original")
-                    return floorplan_image
-            else:
-                print("  ✗ No image generated, using original")
-                return floorplan_image
+            if self.cache_enabled:
+                # Shared between requests, so guard against in-place edits
+                realistic_image.setflags(write=False)
+                if len(_REALISTIC_CACHE) >= _REALISTIC_CACHE_SIZE:
+                    _REALISTIC_CACHE.pop(next(iter(_REALISTIC_CACHE)))
+                _REALISTIC_CACHE[cache_key] = realistic_image
 
-        except Exception as e:
-            print(f"  ✗ Error generating realistic version: {e}")
-            import traceback
+            logger.info("Successfully generated realistic version")
+            return realistic_image
 
-            traceback.print_exc()
+        except Exception as e:
+            logger.exception("Error generating realistic version: %s", e)
             return floorplan_image  # Fallback to original
 
-    def _reconstruct_masks(
-        self, image: np.ndarray, detected_objects: List[Dict], results: Any
-    ) -> List[np.ndarray]:
-        """Reconstruct mask booleans from the segmentation results."""
-        img_height, img_width = image.shape[:2]
-        masks_bool = []
+    async def _request_tool_input(
+        self,
+        content: List[Dict[str, Any]],
+        tool: Dict[str, Any],
+        max_tokens: int,
+        label: str,
+    ) -> Dict:
+        """
+        Send one user message to Claude, forcing a call to the given tool.
 
-        for result in results:
-            if hasattr(result, "masks") and result.masks is not None:
-                masks = result.masks.data
-                for mask in masks:
-                    if hasattr(mask, "cpu"):
-                        mask_np = mask.cpu().numpy().astype(np.float32)
-                    else:
-                        mask_np = mask.astype(np.float32)
+        Replies are served from the LLM cache when an identical request was
+        answered before.
 
-                    mask_resized = cv2.resize(mask_np, (img_width, img_height))
-                    mask_bool = mask_resized > 0.5
-                    masks_bool.append(mask_bool)
+        Args:
+            content: Content blocks of the user message
+            tool: Tool definition whose input schema the reply must follow
+            max_tokens: Token budget for the reply
+            label: Name of the request used in log output
 
-        return masks_bool
+        Returns:
+            The tool input Claude produced
 
-    async def _classify_single_object_with_claude(
-        self,
-        full_image: np.ndarray,
-        highlighted_image: np.ndarray,
-        masked_crop: np.ndarray,
-        obj_info: Dict,
-        object_number: int,
-    ) -> Dict:
-        """Classify a single object with Claude Sonnet 4.5 vision API."""
+        Raises:
+            ValueError: If the reply was cut off or is missing required fields
+        """
+        required = tool["input_schema"]["required"]
 
-        # Create furniture list
-        furniture_list = "\n".join([f"- {f}" for f in FURNITURE_TYPES])
+        cache_key = None
+        if self.llm_cache:
+            cache_key, cached = await asyncio.to_thread(
+                self.llm_cache.lookup, self.classification_model, tool, max_tokens, content
+            )
+            if cached is not None:
+                result = json.loads(cached)
+                if all(key in result for key in required):
+                    logger.debug("%s: using cached response", label)
+                    return result
 
-        # Calculate aspect ratio for this object
-        width = obj_info["dimensions_normalized"]["width"]
-        height = obj_info["dimensions_normalized"]["height"]
-        aspect_ratio = width / height if height > 0 else 1.0
+        async with self._llm_semaphore:
+            response = await self.anthropic_client.messages.create(
+                model=self.classification_model,
+                max_tokens=max_tokens,
+                temperature=0.1,
+                tools=[tool],
+                tool_choice={"type": "tool", "name": tool["name"]},
+                messages=[{"role": "user", "content": content}],
+            )
 
-        # Create focused prompt for single object
-        prompt = f"""You are a furniture evaluation agent. Your objective is to categorize furniture highlighted within a top-down, 2D floor plan.
+        logger.debug(
+            "%s prompt cache: %d tokens read, %d written",
+            label,
+            response.usage.cache_read_input_tokens or 0,
+            response.usage.cache_creation_input_tokens or 0,
+        )
 
-You will be provided the following data:
-- A top-down, 2D image of the entire floorplan, with all furniture, fixtures, architecture, rooms, etc.
-- A top-down, photorealistic image of the rendered interior, corresponding exactly to the floorplan.
-- A duplicate of the top-down photorealistic image with a specific piece of furniture highlighted.
-- A zoomed in image of the piece of furniture in isolated.
+        # A reply cut off by max_tokens carries a partial tool input
+        if response.stop_reason != "tool_use":
+            raise ValueError(f"{label}: reply stopped with {response.stop_reason!r}")
 
-Your objective is to classify and categorize the piece of furniture based on the data provided to you (images, list of available furniture).
+        tool_use = next(block for block in response.content if block.type == "tool_use")
+        result = dict(tool_use.input)
 
-Available furniture/fixture types (YOU MUST PICK THE furniture_type FROM THIS LIST):
-{furniture_list}
+        missing = [key for key in required if key not in result]
+        if missing:
+            raise ValueError(f"{label}: reply is missing {', '.join(missing)}")
 
-Return ONLY a JSON object in this exact format:
-{{
-    "furniture_type": "<type from available types>",
-    "confidence": "high|medium|low",
-    "reasoning": "<detailed explanation: What do you SEE (texture/color)? Aspect ratio? Position? Room context?>",
-    "rotation": <rotation angle in degrees (0-360), where 0 is north/top of image, 90 is east/right, 180 is south/bottom, 270 is west/left>
-}}
+        # Only complete replies are cached
+        if cache_key:
+            await asyncio.to_thread(self.llm_cache.set, cache_key, json.dumps(result))
 
-Pick correctly!"""
+        return result
+
+    async def _classify_single_object_with_claude(
+        self,
+        full_base64: str,
+        highlighted_base64: str,
+        crop_base64: str,
+        obj_info: Dict,
+        object_number: int,
+    ) -> Dict:
+        """
+        Classify a single object with Claude Sonnet 4.5 vision API.
+
+        All images are passed in already base64-encoded, since the full image
+        is shared by every object and the crop is reused for model matching.
+        """
+
+        # Create focused prompt for single object
+        prompt = _CLASSIFICATION_PROMPT
 
         try:
             # Build content for Claude
             content = [{"type": "text", "text": prompt}]
 
-            # Image 1: FULL realistic floor plan (clean) for overall context
-            full_base64 = self._encode_image_to_base64(full_image)
+            # Image 1: FULL realistic floor plan (clean) for overall context.
+            # The prompt and this image are identical for every object, so
+            # they form a cached prefix shared by the parallel calls.
             content.append(
                 {
                     "type": "image",
@@ -562,11 +1003,11 @@ Pick correctly!"""
                         "media_type": "image/jpeg",
                         "data": full_base64,
                     },
+                    "cache_control": {"type": "ephemeral"},
                 }
             )
 
             # Image 2: FULL realistic floor plan with highlighted object (spatial context)
-            highlighted_base64 = self._encode_image_to_base64(highlighted_image)
             content.append(
                 {
                     "type": "image",
@@ -579,7 +1020,6 @@ Pick correctly!"""
             )
 
             # Image 3: CLOSE-UP masked crop (detailed view of object with generous padding)
-            crop_base64 = self._encode_image_to_base64(masked_crop)
             content.append(
                 {
                     "type": "image",
@@ -592,38 +1032,20 @@ Pick correctly!"""
             )
 
             # Call Claude Sonnet 4.5 API (async)
-            response = await self.anthropic_client.messages.create(
-                model=self.classification_model,
-                max_tokens=500,
-                temperature=0.1,
-                messages=[{"role": "user", "content": content}],
+            classification = await self._request_tool_input(
+                content,
+                _CLASSIFY_TOOL,
+                max_tokens=_CLASSIFY_MAX_TOKENS,
+                label=f"Object #{object_number}",
             )
 
-            # Parse the response
-            response_text = response.content[0].text.strip()
-
-            # Extract JSON from response
-            if "```json" in response_text:
-                json_start = response_text.find("```json") + 7
-                json_end = response_text.find("```", json_start)
-                response_text = response_text[json_start:json_end].strip()
-            elif "```" in response_text:
-                json_start = response_text.find("```") + 3
-                json_end = response_text.find("```", json_start)
-                response_text = response_text[json_start:json_end].strip()
-
-            classification = json.loads(response_text)
-
             # Add object number
             classification["object_number"] = object_number
 
             return classification
 
         except Exception as e:
-            print(f"Error classifying object #{object_number}: {e}")
-            import traceback
-
-            traceback.print_exc()
+            logger.exception("Error classifying object #%d: %s", object_number, e)
 
             # Return error classification
             return {
@@ -633,16 +1055,60 @@ Pick correctly!"""
                 "reasoning": f"Classification failed: {str(e)}",
             }
 
+    async def _classify_and_match_single_object(
+        self,
+        full_base64: str,
+        full_image: np.ndarray,
+        masked_crop: np.ndarray,
+        obj_info: Dict,
+        object_number: int,
+    ) -> Tuple[Dict, int]:
+        """Classify a single object, then match it to its best model variation."""
+        # Encode the per-object images concurrently; the crop is shared by
+        # classification and model matching, so it is encoded only once. The
+        # highlight is drawn in the encoding thread and never kept around.
+        highlighted_base64, crop_base64 = await asyncio.gather(
+            asyncio.to_thread(
+                self._encode_highlighted_image_sync,
+                full_image,
+                obj_info["bbox_pixels"],
+            ),
+            self._encode_image_to_base64(masked_crop, max_edge=512),
+        )
+
+        classification = await self._classify_single_object_with_claude(
+            full_base64=full_base64,
+            highlighted_base64=highlighted_base64,
+            crop_base64=crop_base64,
+            obj_info=obj_info,
+            object_number=object_number,
+        )
+
+        furniture_type = classification.get("furniture_type", "other")
+        model_index = await self._match_object_to_model_variation(
+            crop_base64,  # The cropped realistic object image
+            furniture_type,
+        )
+
+        return classification, model_index
+
     async def _classify_objects_individually(
         self,
         full_image: np.ndarray,
         object_images_and_info: List[Tuple[np.ndarray, Dict]],
-        highlighted_images: List[np.ndarray],
-    ) -> List[Dict]:
-        """Classify all objects in parallel for speed."""
+    ) -> Tuple[List[Dict], List[int]]:
+        """
+        Classify all objects and match them to model variations in parallel.
+
+        Each object's model matching starts as soon as its own classification
+        finishes, rather than waiting for every classification to complete.
+
+        Returns:
+            Tuple of (classifications, model_indices)
+        """
         if not self.anthropic_api_key or not self.anthropic_client:
-            print("Warning: ANTHROPIC_API_KEY not set, skipping classification")
-            return [
+            logger.warning("ANTHROPIC_API_KEY not set, skipping classification")
+            classifications = [
                 {
                     "object_number": i + 1,
                     "furniture_type": "other",
@@ -651,70 +1117,54 @@ Pick correctly!"""
                 }
                 for i in range(len(object_images_and_info))
             ]
+            return classifications, [0] * len(classifications)
+
+        # The full image is identical for every object, so encode it only once
+        full_base64 = await self._encode_image_to_base64(full_image)
 
         # Create classification tasks for all objects
-        print(
-            f"  Creating {len(object_images_and_info)} parallel classification tasks..."
+        logger.debug(
+            "Creating %d parallel classification tasks...", len(object_images_and_info)
         )
 
         tasks = []
-        for i, ((masked_crop, obj_info), highlighted_img) in enumerate(
-            zip(object_images_and_info, highlighted_images)
-        ):
-            task = self._classify_single_object_with_claude(
+        for i, (masked_crop, obj_info) in enumerate(object_images_and_info):
+            task = self._classify_and_match_single_object(
+                full_base64=full_base64,
                 full_image=full_image,
-                highlighted_image=highlighted_img,
                 masked_crop=masked_crop,
                 obj_info=obj_info,
                 object_number=i + 1,
             )
             tasks.append(task)
 
-        # Run all classifications in parallel
-        print(f"  Running {len(tasks)} classifications in parallel...")
-        classifications = await asyncio.gather(*tasks)
+        # Run all classifications (and their model matching) in parallel
+        logger.info("Running %d classifications in parallel...", len(tasks))
+        results = await asyncio.gather(*tasks)
+        classifications = [classification for classification, _ in results]
+        model_indices = [model_index for _, model_index in results]
 
         # Show all results
-        print(f"\n  Classification results:")
+        logger.debug("Classification results:")
         for classification in classifications:
-            obj_num = classification.get("object_number", "?")
-            print(
-                f"    Object {obj_num}: {classification.get('furniture_name', 'Unknown')} "
-                f"(confidence: {classification.get('confidence', 'unknown')})"
+            logger.debug(
+                "Object %s: %s (confidence: %s)",
+                classification.get("object_number", "?"),
+                classification.get("furniture_name", "Unknown"),
+                classification.get("confidence", "unknown"),
             )
 
-        return classifications
+        return classifications, model_indices
 
-    async def _match_object_to_model_variation(
-        self,
-        cropped_object: np.ndarray,
-        furniture_type: str,
-        floorplan_items_dir: str = "floorplan_items",
-    ) -> int:
+    def _read_variation_images(
+        self, furniture_dir: str, max_edge: int = 512
+    ) -> List[Tuple[str, str]]:
         """
-        Match a cropped object image to the best model variation using Claude 4.5 Sonnet.
-
-        Args:
-            cropped_object: The cropped/masked object image
-            furniture_type: The type of furniture (e.g., "door", "bed")
-            floorplan_items_dir: Path to the floorplan_items directory
+        Read and encode (downscaled) the product image of every variation folder.
 
         Returns:
-            Index of the best matching variation (0-based)
+            List of (variation_folder, base64_jpeg) tuples, sorted by folder name
         """
-        if not self.anthropic_api_key or not self.anthropic_client:
-            print(
-                f"  Warning: No API key, defaulting to variation 0 for {furniture_type}"
-            )
-            return 0
-
-        # Build path to furniture type folder
-        furniture_dir = os.path.join(floorplan_items_dir, furniture_type)
-
-        if not os.path.exists(furniture_dir):
-            print(f"  Warning: Furniture directory not found: {furniture_dir}")
-            return 0
-
         # Find all variation folders
         variation_folders = sorted(
             [
@@ -725,16 +1175,9 @@ Pick correctly!"""
             ]
         )
 
-        if not variation_folders:
-            print(f"  Warning: No variations found for {furniture_type}")
-            return 0
-
-        print(f"  Found {len(variation_folders)} variations for {furniture_type}")
-
-        # Load product images from each variation
-        variation_images = []
-        valid_variations = []
+        logger.debug("Found %d variations in %s", len(variation_folders), furniture_dir)
 
+        variations = []
         for var_folder in variation_folders:
             product_image_path = os.path.join(
                 furniture_dir, var_folder, "product_image.png"
@@ -742,57 +1185,87 @@ Pick correctly!"""
             if os.path.exists(product_image_path):
                 img = cv2.imread(product_image_path)
                 if img is not None:
-                    variation_images.append(img)
-                    valid_variations.append(var_folder)
+                    variations.append(
+                        (
+                            var_folder,
+                            self._encode_image_to_base64_sync(img, max_edge=max_edge),
+                        )
+                    )
+
+        logger.debug("Loaded %d product images", len(variations))
+
+        return variations
+
+    async def _load_variation_images(self, furniture_dir: str) -> List[Tuple[str, str]]:
+        """
+        Get the encoded product images for a furniture type, loading them once.
+
+        Concurrent callers for the same type wait on a per-directory lock so the
+        images are only read and encoded a single time.
+        """
+        lock = self._variation_locks.setdefault(furniture_dir, asyncio.Lock())
+        async with lock:
+            if furniture_dir not in self._variation_cache:
+                self._variation_cache[furniture_dir] = await asyncio.to_thread(
+                    self._read_variation_images, furniture_dir
+                )
+
+        return self._variation_cache[furniture_dir]
+
+    async def _match_object_to_model_variation(
+        self,
+        cropped_base64: str,
+        furniture_type: str,
+        floorplan_items_dir: str = "floorplan_items",
+    ) -> int:
+        """
+        Match a cropped object image to the best model variation using Claude 4.5 Sonnet.
+
+        Args:
+            cropped_base64: The cropped/masked object image as base64 JPEG
+            furniture_type: The type of furniture (e.g., "door", "bed")
+            floorplan_items_dir: Path to the floorplan_items directory
 
-        if not variation_images:
-            print(f"  Warning: No valid product images found for {furniture_type}")
+        Returns:
+            Index of the best matching variation (0-based)
+        """
+        if not self.anthropic_api_key or not self.anthropic_client:
+            logger.warning(
+                "No API key, defaulting to variation 0 for %s", furniture_type
+            )
             return 0
 
-        print(f"  Loaded {len(variation_images)} product images")
+        # Build path to furniture type folder
+        furniture_dir = os.path.join(floorplan_items_dir, furniture_type)
 
-        # Build prompt for Claude
-        prompt = f"""You are a furniture matching expert. Your task is to identify which product variation most closely resembles the cropped furniture item from a floorplan.
+        if not os.path.exists(furniture_dir):
+            logger.warning("Furniture directory not found: %s", furniture_dir)
+            return 0
 
-You will be given:
-1. A cropped image of a {furniture_type} from a top-down floorplan view
-2. {len(variation_images)} product images showing different variations of {furniture_type}
+        # Load (cached) product images from each variation
+        variations = await self._load_variation_images(furniture_dir)
 
-Carefully examine the cropped object and compare it with each product variation. Consider:
-- Overall shape and proportions
-- Visual style and design elements
-- Color and material appearance
-- Any distinctive features
+        if not variations:
+            logger.warning("No valid product images found for %s", furniture_type)
+            return 0
 
-Return ONLY a JSON object in this exact format:
-{{
-    "best_match_index": <0-based index of the best matching variation>,
-    "confidence": "high|medium|low",
-    "reasoning": "<brief explanation of why this variation matches best>"
-}}
+        variation_base64s = [var_base64 for _, var_base64 in variations]
 
-The variations are numbered from 0 to {len(variation_images) - 1}."""
+        # Build prompt for Claude
+        prompt = _MATCHING_PROMPT_TEMPLATE.format(
+            furniture_type=furniture_type,
+            num_variations=len(variation_base64s),
+            last_index=len(variation_base64s) - 1,
+        )
 
         try:
             # Build content for Claude
             content = [{"type": "text", "text": prompt}]
 
-            # Add the cropped object image
-            cropped_base64 = self._encode_image_to_base64(cropped_object)
-            content.append(
-                {
-                    "type": "image",
-                    "source": {
-                        "type": "base64",
-                        "media_type": "image/jpeg",
-                        "data": cropped_base64,
-                    },
-                }
-            )
-
-            # Add all variation product images
-            for i, var_img in enumerate(variation_images):
-                var_base64 = self._encode_image_to_base64(var_img)
+            # Add all variation product images first: together with the prompt
+            # they are identical for every object of this type, so the last
+            # variation block ends a cached prefix
+            for i, var_base64 in enumerate(variation_base64s):
                 content.append(
                     {
                         "type": "text",
@@ -809,48 +1282,48 @@ The variations are numbered from 0 to {len(variation_images) - 1}."""
                         },
                     }
                 )
+            content[-1]["cache_control"] = {"type": "ephemeral"}
 
-            # Call Claude Sonnet 4.5
-            response = await self.anthropic_client.messages.create(
-                model=self.classification_model,
-                max_tokens=300,
-                temperature=0.1,
-                messages=[{"role": "user", "content": content}],
+            # Add the cropped object image
+            content.append({"type": "text", "text": "Cropped object:"})
+            content.append(
+                {
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "media_type": "image/jpeg",
+                        "data": cropped_base64,
+                    },
+                }
             )
 
-            # Parse response
-            response_text = response.content[0].text.strip()
-
-            # Extract JSON
-            if "```json" in response_text:
-                json_start = response_text.find("```json") + 7
-                json_end = response_text.find("```", json_start)
-                response_text = response_text[json_start:json_end].strip()
-            elif "```" in response_text:
-                json_start = response_text.find("```") + 3
-                json_end = response_text.find("```", json_start)
-                response_text = response_text[json_start:json_end].strip()
-
-            result = json.loads(response_text)
+            # Call Claude Sonnet 4.5
+            result = await self._request_tool_input(
+                content,
+                _MATCH_TOOL,
+                max_tokens=_MATCH_MAX_TOKENS,
+                label=f"{furniture_type} match",
+            )
             best_match = result.get("best_match_index", 0)
             confidence = result.get("confidence", "unknown")
             reasoning = result.get("reasoning", "")
 
-            print(f"    Best match: variation {best_match} (confidence: {confidence})")
-            print(f"    Reasoning: {reasoning}")
+            logger.debug(
+                "Best match: variation %s (confidence: %s). Reasoning: %s",
+                best_match,
+                confidence,
+                reasoning,
+            )
 
             # Ensure index is valid
-            if 0 <= best_match < len(variation_images):
+            if 0 <= best_match < len(variation_base64s):
                 return best_match
             else:
-                print(f"  Warning: Invalid index {best_match}, defaulting to 0")
+                logger.warning("Invalid index %s, defaulting to 0", best_match)
                 return 0
 
         except Exception as e:
-            print(f"  Error matching {furniture_type} to model: {e}")
-            import traceback
-
-            traceback.print_exc()
+            logger.exception("Error matching %s to model: %s", furniture_type, e)
             return 0
 
     async def extract_and_classify_furniture(
@@ -887,68 +1360,57 @@ The variations are numbered from 0 to {len(variation_images) - 1}."""
 
         # Check API keys
         if self.gemini_api_key:
-            print(f"✓ Gemini API key found (for realistic rendering)")
+            logger.debug("Gemini API key found (for realistic rendering)")
         else:
-            print("✗ WARNING: GEMINI_API_KEY not set - will use original schematic")
+            logger.warning("GEMINI_API_KEY not set - will use original schematic")
 
         if self.anthropic_api_key:
-            print(
-                f"✓ Anthropic API key found (for classification with Claude Sonnet 4.5)"
+            logger.debug(
+                "Anthropic API key found (for classification with Claude Sonnet 4.5)"
             )
         else:
-            print(
-                "✗ WARNING: ANTHROPIC_API_KEY not set - classification will be skipped!"
-            )
-
-        # Segment the image with filtering
-        print(f"Segmenting image...")
-        results, detected_objects = self._segment_image(
-            image,
-            conf=conf,
-            iou=iou,
-            enable_filtering=enable_filtering,
-            max_size_ratio=max_size_ratio,
-            overlap_threshold=overlap_threshold,
+            logger.warning("ANTHROPIC_API_KEY not set - classification will be skipped!")
+
+        # Segment the image with filtering while the realistic rendered version
+        # (used for better classification) is generated, since neither depends
+        # on the other
+        logger.info("Segmenting image and generating realistic rendered version...")
+        (results, detected_objects, masks_bool), realistic_image = await asyncio.gather(
+            self._segment_image(
+                image,
+                conf=conf,
+                iou=iou,
+                enable_filtering=enable_filtering,
+                max_size_ratio=max_size_ratio,
+                overlap_threshold=overlap_threshold,
+            ),
+            self._generate_realistic_floorplan(image),
         )
 
         if not detected_objects:
-            print("No objects detected in the image")
+            logger.info("No objects detected in the image")
             return []
 
-        print(f"Found {len(detected_objects)} objects")
-
-        # Reconstruct masks
-        print("Reconstructing masks...")
-        masks_bool = self._reconstruct_masks(image, detected_objects, results)
-
-        # Generate realistic rendered version for better classification
-        print("\nGenerating realistic rendered version for classification...")
-        realistic_image = await self._generate_realistic_floorplan(image)
+        logger.info("Found %d objects", len(detected_objects))
 
         # Create highlighted images and masked crops from realistic version
-        print("Extracting objects from realistic version...")
+        logger.info("Extracting objects from realistic version...")
         object_images_and_info = []
-        highlighted_images = []
 
-        for i, obj in enumerate(detected_objects):
-            if i < len(masks_bool):
-                mask_bool = masks_bool[i]
+        for obj in detected_objects:
+            mask_bool = masks_bool[obj["mask_index"]]
 
-                # Extract masked crop from REALISTIC version with generous 20% padding
-                realistic_crop = self._extract_object_image(
-                    realistic_image, mask_bool, obj["bbox_pixels"], padding_percent=0.20
-                )
-
-                # Create highlighted image from REALISTIC version
-                highlighted_realistic = self._create_highlighted_image(
-                    realistic_image, obj["bbox_pixels"]
-                )
+            # Extract masked crop from REALISTIC version with generous 20% padding
+            realistic_crop = self._extract_object_image(
+                realistic_image, mask_bool, obj["bbox_pixels"], padding_percent=0.20
+            )
 
-                object_images_and_info.append((realistic_crop, obj))
-                highlighted_images.append(highlighted_realistic)
+            # Highlighted images of the REALISTIC version are drawn on demand
+            # when they are encoded or saved, rather than kept for every object
+            object_images_and_info.append((realistic_crop, obj))
 
         if not object_images_and_info:
-            print("No objects to classify")
+            logger.info("No objects to classify")
             return []
 
         # Save debug images if enabled
@@ -961,88 +1423,99 @@ The variations are numbered from 0 to {len(variation_images) - 1}."""
             debug_dir = f"{debug_output_dir}/{timestamp}"
             os.makedirs(debug_dir, exist_ok=True)
 
-            print(f"\nSaving debug images to: {debug_dir}/")
-
-            # Save the original schematic floorplan
-            original_path = f"{debug_dir}/00a_original_schematic.jpg"
-            cv2.imwrite(original_path, image)
-            print(f"  Saved original schematic: {original_path}")
-
-            # Save the realistic rendered version
-            realistic_path = f"{debug_dir}/00b_realistic_rendered.jpg"
-            cv2.imwrite(realistic_path, realistic_image)
-            print(f"  Saved realistic rendered: {realistic_path}")
+            logger.info("Saving debug images to: %s/", debug_dir)
 
-            # Save each highlighted image and masked crop (from realistic version)
-            for i, (highlighted_img, (masked_crop, _)) in enumerate(
-                zip(highlighted_images, object_images_and_info)
-            ):
-                obj = detected_objects[i]
+            # Write every file in worker threads while the objects are classified.
+            # Original schematic floorplan and the realistic rendered version:
+            writes = [
+                asyncio.to_thread(
+                    cv2.imwrite,
+                    f"{debug_dir}/00a_original_schematic.jpg",
+                    image,
+                    _DEBUG_JPEG_PARAMS,
+                ),
+                asyncio.to_thread(
+                    cv2.imwrite,
+                    f"{debug_dir}/00b_realistic_rendered.jpg",
+                    realistic_image,
+                    _DEBUG_JPEG_PARAMS,
+                ),
+            ]
 
-                # Save highlighted full realistic image
-                highlighted_path = (
-                    f"{debug_dir}/{i+1:02d}a_object_{i+1}_highlighted.jpg"
+            # Each highlighted image and masked crop (from realistic version)
+            for i, (masked_crop, obj) in enumerate(object_images_and_info):
+                writes.append(
+                    asyncio.to_thread(
+                        self._write_highlighted_image,
+                        f"{debug_dir}/{i+1:02d}a_object_{i+1}_highlighted.jpg",
+                        realistic_image,
+                        obj["bbox_pixels"],
+                    )
+                )
+                writes.append(
+                    asyncio.to_thread(
+                        cv2.imwrite,
+                        f"{debug_dir}/{i+1:02d}b_object_{i+1}_crop.jpg",
+                        masked_crop,
+                        _DEBUG_JPEG_PARAMS,
+                    )
                 )
-                cv2.imwrite(highlighted_path, highlighted_img)
-                print(f"  Saved highlighted object #{i+1}: {highlighted_path}")
-
-                # Save masked crop from realistic version
-                crop_path = f"{debug_dir}/{i+1:02d}b_object_{i+1}_crop.jpg"
-                cv2.imwrite(crop_path, masked_crop)
-                print(f"  Saved realistic crop #{i+1}: {crop_path}")
-
-            print(f"\n✓ Saved {2 + len(highlighted_images) * 2} debug images\n")
 
-        # Classify each object individually with realistic rendered images
-        print(
-            f"\nClassifying {len(object_images_and_info)} objects individually using realistic renders..."
-        )
-        classifications = await self._classify_objects_individually(
-            realistic_image,  # Pass realistic rendered version (clean, no highlights)
-            object_images_and_info,
-            highlighted_images,  # Pass realistic images with individual object highlights
-        )
+            # Failed writes are collected rather than raised, so they never
+            # mask a classification error
+            debug_writes = asyncio.gather(*writes, return_exceptions=True)
 
-        # Match each object to its best model variation IN PARALLEL
-        print(
-            f"\nMatching {len(object_images_and_info)} objects to model variations in parallel..."
+        # Classify each object individually with realistic rendered images, and
+        # match each one to its best model variation IN PARALLEL
+        logger.info(
+            "Classifying and matching %d objects individually using realistic renders...",
+            len(object_images_and_info),
         )
+        try:
+            classifications, model_indices = await self._classify_objects_individually(
+                realistic_image,  # Pass realistic rendered version (clean, no highlights)
+                object_images_and_info,
+            )
+        finally:
+            # Await the writes even if classification fails, so none is left orphaned
+            if save_debug_images:
+                write_results = await debug_writes
 
-        # Create matching tasks for all objects
-        matching_tasks = []
-        for i, ((obj_image, obj), classification) in enumerate(
-            zip(object_images_and_info, classifications)
-        ):
-            furniture_type = classification.get("furniture_type", "other")
-            print(f"  Creating task for object #{i+1} ({furniture_type})...")
-
-            task = self._match_object_to_model_variation(
-                obj_image,  # The cropped realistic object image
-                furniture_type,
+        if save_debug_images:
+            # cv2.imwrite reports failure by returning False
+            failed = sum(
+                1 for r in write_results if isinstance(r, Exception) or r is False
             )
-            matching_tasks.append(task)
+            if failed:
+                logger.warning("Failed to save %d of %d debug images", failed, len(writes))
+            logger.info("Saved %d debug images", len(writes) - failed)
 
-        # Run all model matching tasks in parallel
-        print(f"  Running {len(matching_tasks)} model matching tasks in parallel...")
-        model_indices = await asyncio.gather(*matching_tasks)
+        # Center positions of every bbox in one vectorized pass
+        bboxes = np.array(
+            [
+                [
+                    obj["bbox_normalized"]["x1"],
+                    obj["bbox_normalized"]["y1"],
+                    obj["bbox_normalized"]["x2"],
+                    obj["bbox_normalized"]["y2"],
+                ]
+                for _, obj in object_images_and_info
+            ],
+            dtype=np.float64,
+        )
+        centers = ((bboxes[:, :2] + bboxes[:, 2:]) / 2).tolist()
 
         # Combine segmentation info with classifications and model matches
         classified_objects = []
 
-        for i, ((obj_image, obj), classification, model_index) in enumerate(
-            zip(object_images_and_info, classifications, model_indices)
+        for (_, obj), classification, model_index, (center_x, center_y) in zip(
+            object_images_and_info, classifications, model_indices, centers
         ):
             # Get furniture type from classification
             furniture_type = classification.get("furniture_type", "other")
 
-            # Calculate this object's actual aspect ratio
             width = obj["dimensions_normalized"]["width"]
             height = obj["dimensions_normalized"]["height"]
-            obj_aspect_ratio = width / height if height > 0 else 1.0
-
-            # Calculate center position from bbox
-            center_x = (obj["bbox_normalized"]["x1"] + obj["bbox_normalized"]["x2"]) / 2
-            center_y = (obj["bbox_normalized"]["y1"] + obj["bbox_normalized"]["y2"]) / 2
 
             # Combine segmentation info with classification in the desired format
             classified_obj = {
@@ -1063,28 +1536,23 @@ The variations are numbered from 0 to {len(variation_images) - 1}."""
             }
             classified_objects.append(classified_obj)
 
-        print(
-            f"\nSuccessfully classified {len(classified_objects)} objects and matched models"
+        logger.info(
+            "Successfully classified %d objects and matched models",
+            len(classified_objects),
         )
 
-        # Print final summary JSON in clean format for debugging
-        print(f"\n{'='*70}")
-        print("FINAL CLASSIFICATION RESULTS")
-        print(f"{'='*70}")
-
-        # Create clean output format (only essential fields)
-        clean_output = []
-        for obj in classified_objects:
-            clean_obj = {
-                "name": obj["name"],
-                "model": obj["model"],
-                "position": obj["position"],
-                "dimensions": obj["dimensions"],
-                "rotation": obj["rotation"],
-            }
-            clean_output.append(clean_obj)
-
-        print(json.dumps(clean_output, indent=2))
-        print(f"{'='*70}\n")
+        # Log final summary JSON (only essential fields) when debugging; it is
+        # only built when DEBUG logging is on
+        if logger.isEnabledFor(logging.DEBUG):
+            clean_output = [
+                {
+                    key: obj[key]
+                    for key in ("name", "model", "position", "dimensions", "rotation")
+                }
+                for obj in classified_objects
+            ]
+            logger.debug(
+                "Final classification results:\n%s", json.dumps(clean_output, indent=2)
+            )
 
         return classified_objects
@@ -1,47 +1,88 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from app.routers import ai, image, floorplan, scene
-from app.config import get_settings
+from app.config import Settings, get_settings
+from app.services.segmentation_service import SegmentationService
+import asyncio
+import httpx
+import logging
 import os
 
 settings = get_settings()
 
-app = FastAPI(title=settings.app_name)
-
-# Configure CORS to allow frontend requests
-# Using wildcard (*) to allow all origins during development
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Allow all origins (development only!)
-    allow_credentials=False,  # Must be False when using wildcard origins
-    allow_methods=["*"],  # Allow all HTTP methods (GET, POST, PUT, DELETE, etc.)
-    allow_headers=["*"],  # Allow all headers
-)
-
-# Mount static files for floorplan icons
-static_path = os.path.join(os.path.dirname(__file__), "floorplan_items")
-if os.path.exists(static_path):
-    app.mount(
-        "/static/floorplan_items",
-        StaticFiles(directory=static_path),
-        name="floorplan_items",
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load FastSAM once and warm it up so the first extraction isn't slow
+    try:
+        await asyncio.to_thread(SegmentationService().warmup)
+    except Exception:
+        logger.exception("FastSAM warmup failed")
+    # Build the OpenAPI schema now; FastAPI caches it for every later /docs hit
+    app.openapi()
+
+    # Every request's SegmentationService shares one cap on in-flight Claude
+    # calls, so concurrent uploads together stay within the rate limits
+    app.state.llm_semaphore = asyncio.Semaphore(
+        app.state.settings.max_concurrent_llm_calls
+    )
+
+    # One connection pool for LLM calls and image downloads, so concurrent requests reuse
+    # warm TCP/TLS connections instead of handshaking per client
+    async with httpx.AsyncClient(
+        timeout=httpx.Timeout(600.0, connect=5.0),
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+    ) as http_client:
+        app.state.http_client = http_client
+        yield
+
+
+def create_app(settings: Settings) -> FastAPI:
+    """Build the FastAPI application with middleware, static files and routers."""
+    app = FastAPI(title=settings.app_name, lifespan=lifespan)
+    app.state.settings = settings
+
+    # Configure CORS to allow frontend requests
+    # Using wildcard (*) to allow all origins during development
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # Allow all origins (development only!)
+        allow_credentials=False,  # Must be False when using wildcard origins
+        allow_methods=["*"],  # Allow all HTTP methods (GET, POST, PUT, DELETE, etc.)
+        allow_headers=["*"],  # Allow all headers
     )
 
-app.include_router(ai.router)
-app.include_router(image.router)
-app.include_router(floorplan.router)
-app.include_router(scene.router)
+    # Mount static files for floorplan icons
+    static_path = os.path.join(os.path.dirname(__file__), "floorplan_items")
+    if os.path.exists(static_path):
+        app.mount(
+            "/static/floorplan_items",
+            StaticFiles(directory=static_path),
+            name="floorplan_items",
+        )
+
+    app.include_router(ai.router)
+    app.include_router(image.router)
+    app.include_router(floorplan.router)
+    app.include_router(scene.router)
+
+    @app.get("/")
+    async def root():
+        return {"message": "Welcome to AI Microservices API"}
 
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
 
-@app.get("/")
-async def root():
-    return {"message": "Welcome to AI Microservices API"}
+    return app
 
 
-@app.get("/health")
-async def health():
-    return {"status": "healthy"}
+app = create_app(settings)
 
 
 if __name__ == "__main__":
@@ -2,20 +2,54 @@ import httpx
 import asyncio
 import os
 
+import pytest
+
 
 BASE_URL = "http://localhost:8001"
 OUTPUT_DIR = "e2e_output_images"
+STREAM_CHUNK_SIZE = 64 * 1024
 
 
-def save_image(image_bytes: bytes, filename: str):
+def output_path(filename: str) -> str:
     os.makedirs(OUTPUT_DIR, exist_ok=True)
-    filepath = os.path.join(OUTPUT_DIR, filename)
-    with open(filepath, "wb") as f:
-        f.write(image_bytes)
-    print(f"  💾 Saved: {filepath}")
+    return os.path.join(OUTPUT_DIR, filename)
 
 
-async def create_dummy_sketch() -> bytes:
+async def post_checked(client: httpx.AsyncClient, url: str, **kwargs) -> httpx.Response:
+    """POST to url and raise on an error status, so a TaskGroup sees the failure."""
+    response = await client.post(url, **kwargs)
+    return response.raise_for_status()
+
+
+async def stream_image(client: httpx.AsyncClient, url: str, filename: str, **kwargs) -> str:
+    """POST to url and stream the image response straight to OUTPUT_DIR."""
+    filepath = output_path(filename)
+    total = 0
+    async with client.stream("POST", url, **kwargs) as response:
+        # An error body must not be saved as an image
+        response.raise_for_status()
+        # Unbuffered, so each chunk goes to disk in one write() with no extra copy
+        with open(filepath, "wb", buffering=0) as f:
+            async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE):
+                view = memoryview(chunk)
+                while view:
+                    view = view[f.write(view):]
+                total += len(chunk)
+    assert total > 0, f"Empty response from {url}"
+    print(f"  💾 Saved: {filepath} ({total} bytes)")
+    return filepath
+
+
+def read_image(filepath: str) -> bytes:
+    with open(filepath, "rb") as f:
+        return f.read()
+
+
+# The sketch never changes, so it is drawn and encoded only once per run
+_SKETCH_CACHE: bytes | None = None
+
+
+def _encode_sketch() -> bytes:
     import io
     from PIL import Image, ImageDraw
 
@@ -28,10 +62,23 @@ async def create_dummy_sketch() -> bytes:
     draw.rectangle([100, 250, 300, 400], outline="blue", width=2)
 
     buffer = io.BytesIO()
-    img.save(buffer, format="PNG")
+    # A few lines on white compress well even at the fastest level
+    img.save(buffer, format="PNG", compress_level=1)
     return buffer.getvalue()
 
 
+async def create_dummy_sketch() -> bytes:
+    global _SKETCH_CACHE
+    if _SKETCH_CACHE is None:
+        # Drawing and PNG encoding are blocking, so keep them off the event loop
+        _SKETCH_CACHE = await asyncio.get_running_loop().run_in_executor(
+            None, _encode_sketch
+        )
+    return _SKETCH_CACHE
+
+
+@pytest.mark.network
+@pytest.mark.asyncio
 async def test_workflow():
     async with httpx.AsyncClient(timeout=120.0) as client:
 
@@ -43,16 +90,46 @@ async def test_workflow():
         sketch_bytes = await create_dummy_sketch()
         files = {"sketch": ("sketch.png", sketch_bytes, "image/png")}
 
-        response = await client.post(f"{BASE_URL}/floorplan/generate", files=files)
-        floorplan_bytes = response.content
-        print(f"   ✓ Floorplan generated ({len(floorplan_bytes)} bytes)")
-        save_image(floorplan_bytes, "01_floorplan.png")
+        floorplan_path = await stream_image(
+            client, f"{BASE_URL}/floorplan/generate", "01_floorplan.png", files=files
+        )
+        print("   ✓ Floorplan generated")
+        # Later stages upload the floorplan, so read it back from disk
+        floorplan_bytes = read_image(floorplan_path)
 
+        # Extraction and revision both only need the floorplan, so run them together
         print("\n2. Extracting objects from floorplan (MingLun Pipeline)...")
-        files = {"floorplan": ("floorplan.png", floorplan_bytes, "image/png")}
+        print("\n3a. Revising floorplan with instruction (Gemini)...")
+        instruction = "add more windows and adjust wall thickness"
+
+        # A TaskGroup cancels the sibling request as soon as either one fails
+        async with asyncio.TaskGroup() as tg:
+            extract_task = tg.create_task(
+                post_checked(
+                    client,
+                    f"{BASE_URL}/floorplan/extract",
+                    files={"floorplan": ("floorplan.png", floorplan_bytes, "image/png")},
+                )
+            )
+            revise_task = tg.create_task(
+                stream_image(
+                    client,
+                    f"{BASE_URL}/floorplan/revise",
+                    "02_revised_floorplan.png",
+                    files={
+                        "annotated_floorplan": (
+                            "floorplan.png",
+                            floorplan_bytes,
+                            "image/png",
+                        )
+                    },
+                    data={"instruction": instruction},
+                )
+            )
+        extract_response = extract_task.result()
+        revised_path = revise_task.result()
 
-        response = await client.post(f"{BASE_URL}/floorplan/extract", files=files)
-        extract_result = response.json()
+        extract_result = extract_response.json()
         objects = extract_result["objects"]
         print(f"   ✓ Extracted {len(objects)} objects")
         for i, obj in enumerate(objects[:3], 1):
@@ -60,31 +137,37 @@ async def test_workflow():
                 f"     Object {i}: {obj.get('type', 'unknown')} at ({obj.get('position', {}).get('x', 0)}, {obj.get('position', {}).get('y', 0)})"
             )
 
-        print("\n3a. Revising floorplan with instruction (Gemini)...")
-        instruction = "add more windows and adjust wall thickness"
-        files = {"annotated_floorplan": ("floorplan.png", floorplan_bytes, "image/png")}
-        data = {"instruction": instruction}
-
-        response = await client.post(
-            f"{BASE_URL}/floorplan/revise", files=files, data=data
-        )
-        revised_floorplan_bytes = response.content
         print(f"   ✓ Floorplan revised with instruction: '{instruction}'")
-        save_image(revised_floorplan_bytes, "02_revised_floorplan.png")
+        revised_floorplan_bytes = read_image(revised_path)
 
+        # The photorealistic render needs the revision, the Unity export only the
+        # extracted objects, so these two also run together
         print("\n3b. Generating photorealistic image from floorplan (Gemini)...")
-        files = {"floorplan": ("floorplan.png", revised_floorplan_bytes, "image/png")}
+        print("\n4. Exporting to Unity format...")
 
-        response = await client.post(f"{BASE_URL}/image/generate", files=files)
-        photorealistic_bytes = response.content
-        print(
-            f"   ✓ Photorealistic image generated ({len(photorealistic_bytes)} bytes)"
-        )
-        save_image(photorealistic_bytes, "03_photorealistic.png")
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(
+                stream_image(
+                    client,
+                    f"{BASE_URL}/image/generate",
+                    "03_photorealistic.png",
+                    files={
+                        "floorplan": (
+                            "floorplan.png",
+                            revised_floorplan_bytes,
+                            "image/png",
+                        )
+                    },
+                )
+            )
+            unity_task = tg.create_task(
+                post_checked(client, f"{BASE_URL}/scene/export", json=objects)
+            )
+        unity_response = unity_task.result()
 
-        print("\n4. Exporting to Unity format...")
-        response = await client.post(f"{BASE_URL}/scene/export", json=objects)
-        unity_result = response.json()
+        print("   ✓ Photorealistic image generated")
+
+        unity_result = unity_response.json()
         unity_scene = unity_result["unity_scene"]
         print(f"   ✓ Exported {len(unity_scene['objects'])} objects to Unity format")
         print(
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the SQLite LLM response cache.
+"""
+
+import pytest
+
+from app.config import Settings
+from app.services import llm_cache
+from app.services.llm_cache import LLMCache, get_llm_cache
+
+
+class FakeClock:
+    """Replaces time.time in the cache module so tests can jump past the TTL."""
+
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(llm_cache.time, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    return LLMCache(str(tmp_path / "cache.sqlite3"), ttl_days=1)
+
+
+def count_rows(cache: LLMCache, table: str) -> int:
+    return cache._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_set_then_get_round_trips(cache):
+    key = cache.make_key("model", "prompt", 1)
+
+    assert cache.get(key) is None
+    cache.set(key, '{"answer": 1}')
+
+    assert cache.get(key) == '{"answer": 1}'
+    assert cache.lookup("model", "prompt", 1) == (key, '{"answer": 1}')
+
+
+def test_blob_round_trips_as_bytes(cache):
+    key = cache.make_key("render", "floorplan")
+    data = bytes(range(256))
+
+    assert cache.get_blob(key) is None
+    cache.set_blob(key, data)
+
+    assert cache.get_blob(key) == data
+
+
+def test_entries_expire_after_ttl(cache, clock):
+    cache.set("text", "reply")
+    cache.set_blob("blob", b"image")
+
+    clock.now += 24 * 60 * 60 - 1
+    assert cache.get("text") == "reply"
+    assert cache.get_blob("blob") == b"image"
+
+    clock.now += 2
+    assert cache.get("text") is None
+    assert cache.get_blob("blob") is None
+
+
+def test_writes_purge_expired_rows(cache, clock):
+    cache.set("old", "reply")
+    cache.set_blob("old", b"image")
+
+    clock.now += 2 * 24 * 60 * 60
+    cache.set("new", "reply")
+
+    assert count_rows(cache, "llm_cache") == 1
+    assert count_rows(cache, "blob_cache") == 0
+    assert cache.get("new") == "reply"
+
+
+@pytest.fixture
+def clear_shared_cache():
+    get_llm_cache.cache_clear()
+    yield
+    get_llm_cache.cache_clear()
+
+
+def test_shared_cache_is_none_when_disabled(monkeypatch, clear_shared_cache):
+    monkeypatch.setattr(
+        llm_cache, "get_settings", lambda: Settings(llm_cache_enabled=False)
+    )
+
+    assert get_llm_cache() is None
+
+
+def test_shared_cache_uses_configured_path(monkeypatch, tmp_path, clear_shared_cache):
+    path = tmp_path / "shared.sqlite3"
+    monkeypatch.setattr(
+        llm_cache, "get_settings", lambda: Settings(llm_cache_path=str(path))
+    )
+
+    shared = get_llm_cache()
+
+    assert isinstance(shared, LLMCache)
+    assert get_llm_cache() is shared
+    assert path.exists()
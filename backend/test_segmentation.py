@@ -1,130 +1,354 @@
 #!/usr/bin/env python3
 """
-Test script to verify segmentation and classification work correctly.
+Tests to verify segmentation and classification are set up correctly, plus
+unit tests for the FastSAM micro-batcher and mask filtering.
+
+Run with pytest; the environment and model checks do not import the
+segmentation service, so they stay fast even when Torch is slow to load.
 """
 
+import asyncio
+import logging
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = Path(__file__).parent / "FastSAM-s.pt"
+
+
+@pytest.fixture(scope="session")
+def fastsam_model_path() -> Path:
+    """FastSAM weights, checked once; dependent tests skip when they are missing."""
+    if not MODEL_PATH.exists():
+        pytest.skip(f"{MODEL_PATH.name} not found; run setup_model.py")
+    return MODEL_PATH
+
+
+@pytest.fixture(scope="session")
+def segmentation_service(fastsam_model_path):
+    """Segmentation service shared by every test in the session."""
+    from app.services.segmentation_service import SegmentationService
+
+    return SegmentationService(model_path=str(fastsam_model_path))
+
+
+@pytest.fixture
+def batcher():
+    """Fresh micro-batcher, so tests never share queued requests."""
+    from app.services.segmentation_service import _FastSAMBatcher
+
+    return _FastSAMBatcher(max_batch=8, max_wait=0.05)
+
+
+class FakeFastSAM:
+    """Stands in for FastSAM: returns (pixel sum, conf) per image and records batches."""
+
+    def __init__(self, fail: bool = False, delay: float = 0.1):
+        self.fail = fail
+        self.delay = delay
+        self.batches = []
+        self.shapes = []
+
+    def __call__(self, images, **kwargs):
+        self.batches.append((len(images), kwargs))
+        self.shapes.append({image.shape for image in images})
+        # Keep the forward pass busy so concurrent callers queue up behind it
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("inference failed")
+        return [(int(image.sum()), kwargs.get("conf")) for image in images]
+
+
+class FakeAnthropicMessages:
+    """Stands in for AsyncAnthropic.messages, replying with one forced tool call."""
+
+    def __init__(self, stop_reason: str, tool_input: dict):
+        self.stop_reason = stop_reason
+        self.tool_input = tool_input
+
+    async def create(self, **kwargs):
+        return SimpleNamespace(
+            stop_reason=self.stop_reason,
+            usage=SimpleNamespace(
+                cache_read_input_tokens=0, cache_creation_input_tokens=0
+            ),
+            content=[SimpleNamespace(type="tool_use", input=self.tool_input)],
+        )
+
+
+@pytest.fixture
+def offline_service(fastsam_model_path):
+    """Service with a fake Claude client and no LLM cache, for per-test edits."""
+    from app.services.segmentation_service import SegmentationService
+
+    service = SegmentationService(model_path=str(fastsam_model_path))
+    service.anthropic_api_key = "test"
+    service.llm_cache = None
+    return service
+
+
+def run_concurrently(fn, count: int):
+    """Call fn(i) for i in range(count) from count threads released together."""
+    barrier = threading.Barrier(count)
+
+    def call(i):
+        barrier.wait()
+        return fn(i)
+
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        futures = [pool.submit(call, i) for i in range(count)]
+    return [future.exception() or future.result() for future in futures]
+
+
+def pairwise_filter_masks(masks_bool, img_shape, max_size_ratio=0.5, overlap_threshold=0.5):
+    """Reference filter: the original pairwise overlap check, mask by mask."""
+    img_height, img_width = img_shape[:2]
+    mask_data = []
+    for i, mask in enumerate(masks_bool):
+        coords = np.argwhere(mask)
+        if len(coords) == 0:
+            continue
+        y1, x1 = coords.min(axis=0)
+        y2, x2 = coords.max(axis=0)
+        if (x2 - x1 + 1) / img_width > max_size_ratio or (
+            y2 - y1 + 1
+        ) / img_height > max_size_ratio:
+            continue
+        mask_data.append((i, mask, int(mask.sum())))
+
+    mask_data.sort(key=lambda m: m[2], reverse=True)
+    to_keep, to_remove = [], set()
+    for i, (index_i, mask_i, area_i) in enumerate(mask_data):
+        if i in to_remove:
+            continue
+        to_keep.append(index_i)
+        for j in range(i + 1, len(mask_data)):
+            if j in to_remove:
+                continue
+            _, mask_j, area_j = mask_data[j]
+            overlap = np.logical_and(mask_i, mask_j).sum() / min(area_i, area_j)
+            if overlap > overlap_threshold:
+                to_remove.add(j)
+    return sorted(to_keep)
+
 
 def test_env_loading():
     """Test if environment variables are loaded correctly."""
-    print("=" * 60)
-    print("Testing Environment Variable Loading")
-    print("=" * 60)
-
     gemini_key = os.environ.get("GEMINI_API_KEY")
+    if not gemini_key:
+        pytest.skip("GEMINI_API_KEY is not set, please check your .env file")
 
-    if gemini_key:
-        print("[OK] GEMINI_API_KEY is set")
-        print(f"  Length: {len(gemini_key)} characters")
-        print(f"  First 10 chars: {gemini_key[:10]}...")
-        print(f"  Last 10 chars: ...{gemini_key[-10:]}")
-    else:
-        print("[ERROR] GEMINI_API_KEY is NOT set")
-        print("\nPlease check your .env file!")
-        return False
-
-    return True
+    logger.debug("GEMINI_API_KEY length: %d characters", len(gemini_key))
 
 
 def test_fastsam_model():
     """Test if FastSAM model exists."""
-    print("\n" + "=" * 60)
-    print("Testing FastSAM Model")
-    print("=" * 60)
+    assert MODEL_PATH.exists(), (
+        f"FastSAM model NOT found: {MODEL_PATH}, run: python setup_model.py"
+    )
+    logger.debug("FastSAM model size: %.2f MB", MODEL_PATH.stat().st_size / (1024 * 1024))
+
 
-    model_path = "FastSAM-s.pt"
+def test_segmentation_service(segmentation_service):
+    """Test if segmentation service can be imported and initialized."""
+    # The Gemini client exists exactly when an API key is configured
+    assert (segmentation_service.gemini_client is not None) == bool(
+        segmentation_service.gemini_api_key
+    )
+    logger.debug(
+        "Gemini client: %s",
+        "Initialized" if segmentation_service.gemini_client else "Not initialized",
+    )
 
-    if os.path.exists(model_path):
-        size_mb = os.path.getsize(model_path) / (1024 * 1024)
-        print(f"[OK] FastSAM model found: {model_path}")
-        print(f"  Size: {size_mb:.2f} MB")
-    else:
-        print(f"[ERROR] FastSAM model NOT found: {model_path}")
-        print("\nRun: python setup_model.py")
-        return False
 
-    return True
+def test_batcher_lone_caller_does_not_wait(batcher):
+    """A single request on an idle batcher runs without the batching delay."""
+    batcher.max_wait = 1.0
+    model = FakeFastSAM(delay=0)
+
+    start = time.monotonic()
+    result = batcher.predict(model, np.ones((2, 2, 3), dtype=np.uint8), conf=0.4)
+
+    assert result == (12, 0.4)
+    assert time.monotonic() - start < 0.5
+
+
+def test_batcher_batches_concurrent_callers(batcher):
+    """Concurrent requests share forward passes and each gets its own result."""
+    model = FakeFastSAM()
+
+    results = run_concurrently(
+        lambda i: batcher.predict(model, np.full((2, 2, 3), i, dtype=np.uint8), conf=0.4),
+        6,
+    )
+
+    assert results == [(12 * i, 0.4) for i in range(6)]
+    assert sum(size for size, _ in model.batches) == 6
+    assert len(model.batches) < 6
+
+
+def test_batcher_keeps_mismatched_kwargs_apart(batcher):
+    """Requests with different inference arguments never share a batch."""
+    model = FakeFastSAM()
+    confs = [0.2, 0.4]
+
+    results = run_concurrently(
+        lambda i: batcher.predict(
+            model, np.full((2, 2, 3), i, dtype=np.uint8), conf=confs[i % 2]
+        ),
+        6,
+    )
+
+    assert results == [(12 * i, confs[i % 2]) for i in range(6)]
+    assert sum(size for size, _ in model.batches) == 6
+
+
+def test_batcher_keeps_mismatched_shapes_apart(batcher):
+    """Images of different sizes never share a batch."""
+    model = FakeFastSAM()
+
+    results = run_concurrently(
+        lambda i: batcher.predict(model, np.ones((2 + i % 2, 2, 3), dtype=np.uint8)),
+        6,
+    )
+
+    assert results == [((2 + i % 2) * 6, None) for i in range(6)]
+    assert all(len(shapes) == 1 for shapes in model.shapes)
+
+
+def test_batcher_propagates_errors_to_the_whole_batch(batcher):
+    """A failed forward pass raises in every caller and leaves the batcher usable."""
+    failing = FakeFastSAM(fail=True)
+
+    results = run_concurrently(
+        lambda i: batcher.predict(failing, np.zeros((2, 2, 3), dtype=np.uint8)), 4
+    )
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert batcher.predict(
+        FakeFastSAM(delay=0), np.ones((2, 2, 3), dtype=np.uint8), conf=0.4
+    ) == (12, 0.4)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_filter_masks_matches_pairwise_overlap(segmentation_service, seed):
+    """The packed, vectorized NMS keeps exactly the masks the pairwise check keeps."""
+    rng = np.random.default_rng(seed)
+    height, width = 60, 80
+    masks = np.zeros((40, height, width), dtype=bool)
+    for mask in masks:
+        # Mostly small boxes that overlap often, plus some too large to keep
+        h, w = rng.integers(2, 40, size=2)
+        y, x = rng.integers(0, height - h), rng.integers(0, width - w)
+        mask[y : y + h, x : x + w] = True
+    # An empty mask and an exact duplicate (equal areas tie-break by index)
+    masks[5] = False
+    masks[7] = masks[6]
+
+    areas = np.count_nonzero(masks, axis=(1, 2))
+    kept = segmentation_service._filter_masks(masks, areas, (height, width, 3))
+
+    assert kept == pairwise_filter_masks(masks, (height, width, 3))
+
+
+def test_truncated_match_is_logged(offline_service, tmp_path, caplog):
+    """A match reply cut off by max_tokens is logged as an error, not taken as-is."""
+    variation_dir = tmp_path / "bed" / "variation_1"
+    variation_dir.mkdir(parents=True)
+    cv2.imwrite(str(variation_dir / "product_image.png"), np.zeros((8, 8, 3), np.uint8))
+    offline_service.anthropic_client = SimpleNamespace(
+        messages=FakeAnthropicMessages("max_tokens", {"best_match_index": 0})
+    )
 
+    with caplog.at_level(logging.ERROR, logger="app.services.segmentation_service"):
+        index = asyncio.run(
+            offline_service._match_object_to_model_variation(
+                "", "bed", floorplan_items_dir=str(tmp_path)
+            )
+        )
 
-def test_segmentation_service():
-    """Test if segmentation service can be imported and initialized."""
-    print("\n" + "=" * 60)
-    print("Testing Segmentation Service")
-    print("=" * 60)
+    assert index == 0
+    assert any("max_tokens" in record.getMessage() for record in caplog.records)
 
-    try:
-        from app.services.segmentation_service import SegmentationService
 
-        print("[OK] SegmentationService imported successfully")
+def test_truncated_classification_is_an_error(offline_service):
+    """A classification cut off by max_tokens is reported as failed, not accepted."""
+    offline_service.anthropic_client = SimpleNamespace(
+        messages=FakeAnthropicMessages("max_tokens", {"furniture_type": "bed"})
+    )
 
-        service = SegmentationService()
-        print("[OK] Service initialized")
-        print(f"  Model path: {service.model_path}")
-        print(f"  Gemini model: {service.gemini_model}")
-        print(f"  API key set: {'Yes' if service.gemini_api_key else 'No'}")
-        print(
-            f"  Gemini client: {'Initialized' if service.gemini_client else 'Not initialized'}"
-        )
+    result = asyncio.run(
+        offline_service._classify_single_object_with_claude("", "", "", {}, 1)
+    )
 
-        if service.gemini_api_key:
-            print(f"  API key length: {len(service.gemini_api_key)}")
+    assert result["confidence"] == "error"
+    assert "max_tokens" in result["reasoning"]
 
-        return True
-    except Exception as e:
-        print(f"[ERROR] Error initializing service: {e}")
-        import traceback
 
-        traceback.print_exc()
-        return False
+class FakeGeminiModels:
+    """Stands in for the Gemini async models API, returning one fixed render."""
 
+    def __init__(self, render: np.ndarray):
+        self.render = cv2.imencode(".png", render)[1].tobytes()
+        self.calls = 0
 
-def main():
-    """Run all tests."""
-    print("\n" + "=" * 60)
-    print("SEGMENTATION & CLASSIFICATION TEST SUITE")
-    print("=" * 60 + "\n")
+    async def generate_content(self, **kwargs):
+        self.calls += 1
+        part = SimpleNamespace(inline_data=SimpleNamespace(data=self.render))
+        return SimpleNamespace(
+            candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))]
+        )
 
-    tests = [
-        ("Environment Variables", test_env_loading),
-        ("FastSAM Model", test_fastsam_model),
-        ("Segmentation Service", test_segmentation_service),
-    ]
 
-    results = {}
+def test_render_is_regenerated_when_caching_is_disabled(offline_service):
+    """With llm_cache_enabled off, every render goes back to Gemini."""
+    models = FakeGeminiModels(np.full((8, 8, 3), 7, dtype=np.uint8))
+    offline_service.gemini_client = SimpleNamespace(models=models)
+    offline_service.cache_enabled = False
+    floorplan = np.zeros((8, 8, 3), dtype=np.uint8)
 
-    for test_name, test_func in tests:
-        try:
-            results[test_name] = test_func()
-        except Exception as e:
-            print(f"\n[ERROR] Test '{test_name}' crashed: {e}")
-            results[test_name] = False
+    for _ in range(2):
+        render = asyncio.run(offline_service._generate_realistic_floorplan(floorplan))
+        assert render.shape == (8, 8, 3)
 
-    # Summary
-    print("\n" + "=" * 60)
-    print("TEST SUMMARY")
-    print("=" * 60)
+    assert models.calls == 2
 
-    for test_name, passed in results.items():
-        status = "[PASS]" if passed else "[FAIL]"
-        print(f"  {status}: {test_name}")
 
-    all_passed = all(results.values())
+def test_disabled_setting_turns_off_every_llm_cache(fastsam_model_path, monkeypatch):
+    """LLM_CACHE_ENABLED=false leaves the service with no reply or render cache."""
+    from app.config import Settings
+    from app.services import segmentation_service
+    from app.services.llm_cache import get_llm_cache
 
-    print("\n" + "=" * 60)
-    if all_passed:
-        print("[OK] ALL TESTS PASSED - Ready to use!")
-    else:
-        print("[ERROR] SOME TESTS FAILED - Please fix the issues above")
-    print("=" * 60 + "\n")
+    monkeypatch.setenv("LLM_CACHE_ENABLED", "false")
+    settings = Settings()
+    monkeypatch.setattr(segmentation_service, "get_settings", lambda: settings)
+    monkeypatch.setattr("app.services.llm_cache.get_settings", lambda: settings)
+    get_llm_cache.cache_clear()
+    try:
+        service = segmentation_service.SegmentationService(
+            model_path=str(fastsam_model_path)
+        )
+    finally:
+        get_llm_cache.cache_clear()
 
-    return 0 if all_passed else 1
+    assert service.llm_cache is None
+    assert service.cache_enabled is False
 
 
 if __name__ == "__main__":
-    sys.exit(main())
+    sys.exit(pytest.main([__file__, *sys.argv[1:]]))